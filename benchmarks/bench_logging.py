@@ -0,0 +1,113 @@
+"""Benchmark the logging overhead of `Study.search`, `load` and `save`.
+
+Each operation is timed with logs disabled (WARNING), written to the
+terminal handler (INFO) and written by the background thread of the queue
+handler (INFO + queue). Logs are sent to /dev/null. The formatting of a
+record by the previous formatter (rebuilt for each record) is compared to
+the current one.
+
+A temporary study is registered for the benchmark and removed afterwards.
+
+Run with :
+
+    python benchmarks/bench_logging.py
+"""
+import os
+import re
+import logging
+import tempfile
+from shutil import rmtree
+from timeit import repeat
+from uuid import uuid4
+
+import numpy as np
+
+from pathta import Study
+from pathta.syslog import (_lh, _Formatter, set_log_level, set_log_queue,
+                           formatter_message, COLORS, COLOR_SEQ, RESET_SEQ,
+                           FORMAT, RED, WHITE)
+
+
+class _LegacyFormatter(logging.Formatter):
+    """Previous formatter, rebuilding the format for each record."""
+
+    def __init__(self, format_type='compact'):
+        logging.Formatter.__init__(self, FORMAT[format_type])
+        self._format_type = format_type
+
+    def format(self, record):
+        name = record.levelname
+        msg = record.getMessage()
+        if '*' in msg:
+            regexp = r'\*.*?\*'
+            re_search = re.search(regexp, msg).group()
+            to_color = COLOR_SEQ % (30 + RED) + re_search + COLOR_SEQ % (
+                30 + WHITE) + RESET_SEQ
+            record.msg = re.sub(regexp, to_color, msg) + RESET_SEQ
+        record.levelname = COLOR_SEQ % (30 + COLORS[name]) + name + RESET_SEQ
+        if record.levelno == 20:
+            logging.Formatter.__init__(self, FORMAT['print'])
+        else:
+            logging.Formatter.__init__(self, FORMAT[self._format_type])
+        return formatter_message(logging.Formatter.format(self, record))
+
+
+def _time(fcn, number):
+    return min(repeat(fcn, number=number, repeat=3)) / number
+
+
+def bench_formatter(number=20000):
+    """Print the time spent formatting a record."""
+    print("%-12s %-12s" % ('formatter', 'time (us)'))
+    for name, fmt in [('legacy', _LegacyFormatter()), ('current',
+                                                       _Formatter())]:
+        for level in [logging.INFO, logging.WARNING]:
+            def _format():
+                record = logging.LogRecord('pathta', level, '', 0,
+                                           '    file.npy *saved*', (), None)
+                fmt.format(record)
+            print("%-12s %-12.2f" % ('%s-%s' % (name, logging.getLevelName(
+                level).lower()), 1e6 * _time(_format, number)))
+
+
+def bench_study(n_files=1000, number=200):
+    """Print the time per call of search, load and save."""
+    tmp = tempfile.mkdtemp()
+    name = 'bench_logging_%s' % uuid4().hex[0:8]
+    set_log_level('WARNING')
+    st = Study(name)
+    st.add(tmp)
+    st = Study(name, verbose='WARNING')
+    stream, devnull = _lh.stream, open(os.devnull, 'w')
+    try:
+        for k in range(n_files):
+            open(os.path.join(st.path, 'pow', 'subject_%04i.npy' % k),
+                 'w').close()
+        np.save(os.path.join(st.path, 'raw', 'x.npy'), np.zeros(10))
+        ops = dict(
+            search=lambda v: st.search('subject_0', folder='pow',
+                                       verbose=v),
+            load=lambda v: st.load('x.npy', folder='raw', verbose=v),
+            save=lambda v: (set_log_level(v), st.save(
+                'y.npy', np.zeros(10), folder='raw', duplicate='overwrite')))
+        _lh.setStream(devnull)
+        print("%-8s %-14s %-14s %-14s" % ('op', 'WARNING (us)', 'INFO (us)',
+                                          'INFO+queue (us)'))
+        for op, fcn in ops.items():
+            t_warn = _time(lambda: fcn('WARNING'), number)
+            t_info = _time(lambda: fcn('INFO'), number)
+            set_log_queue(True)
+            t_queue = _time(lambda: fcn('INFO'), number)
+            set_log_queue(False)
+            print("%-8s %-14.1f %-14.1f %-14.1f" % (
+                op, 1e6 * t_warn, 1e6 * t_info, 1e6 * t_queue))
+    finally:
+        _lh.setStream(stream)
+        devnull.close()
+        st._registry.remove(name)
+        rmtree(tmp)
+
+
+if __name__ == '__main__':
+    bench_formatter()
+    bench_study()
@@ -0,0 +1,52 @@
+"""Benchmark the multi-pattern file matcher used by `Study.search`.
+
+The previous implementation tested each (file, pattern) pair in Python.
+The matcher tests each file name once against a single compiled expression
+(one lookahead per pattern for intersections) so that its runtime grows
+linearly with the number of files.
+
+Run with :
+
+    python benchmarks/bench_search.py
+"""
+from itertools import product
+from timeit import repeat
+
+from pathta.search import FileMatcher
+
+
+def _make_files(n_files):
+    """Build a list of file names looking like a `pow/` folder."""
+    return ['subject_%03i_session_%02i_roi_%03i_pow_theta.npz' % (
+        k % 100, k % 7, k % 113) for k in range(n_files)]
+
+
+def _per_cell(files, patterns):
+    """Legacy search, one `str.find` per (file, pattern) cell."""
+    n_files, n_args = len(files), len(patterns)
+    filter_feat = [[False] * n_args for _ in range(n_files)]
+    for i, k in product(range(n_files), range(n_args)):
+        filter_feat[i][k] = bool(files[i].find(patterns[k]) + 1)
+    return [f for f, i in zip(files, filter_feat) if all(i)]
+
+
+def bench(n_files=(10000, 50000, 200000), n_patterns=(1, 3, 6), number=3):
+    """Print the timing of the per-cell and compiled searches."""
+    all_patterns = ['subject_01', 'session_0', 'roi_0', '_pow', 'theta',
+                    '.npz']
+    print("%-9s %-10s %-12s %-12s" % ('n_files', 'patterns', 'per-cell (s)',
+                                      'matcher (s)'))
+    for n_f in n_files:
+        files = _make_files(n_f)
+        for n_p in n_patterns:
+            patterns = all_patterns[0:n_p]
+            matcher = FileMatcher(patterns)
+            t_cell = min(repeat(lambda: _per_cell(files, patterns),
+                                number=number, repeat=3)) / number
+            t_match = min(repeat(lambda: matcher.filter(files),
+                                 number=number, repeat=3)) / number
+            print("%-9i %-10i %-12.4f %-12.4f" % (n_f, n_p, t_cell, t_match))
+
+
+if __name__ == '__main__':
+    bench()
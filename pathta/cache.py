@@ -0,0 +1,165 @@
+"""In-memory cache of loaded files."""
+import os
+import sys
+import logging
+from copy import deepcopy
+from threading import RLock
+from collections import OrderedDict
+
+
+logger = logging.getLogger('pathta')
+
+
+def sizeof(obj):
+    """Estimate the memory used by a loaded object (in bytes)."""
+    if hasattr(obj, 'nbytes') and isinstance(obj.nbytes, int):  # numpy
+        return obj.nbytes
+    if hasattr(obj, 'memory_usage'):  # pandas
+        usage = obj.memory_usage(deep=True)
+        return int(usage.sum()) if hasattr(usage, 'sum') else int(usage)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum([sizeof(k) + sizeof(v) for k, v in
+                                         obj.items()])
+    if isinstance(obj, (list, tuple, set)):
+        return sys.getsizeof(obj) + sum([sizeof(k) for k in obj])
+    return sys.getsizeof(obj)
+
+
+def _freeze(obj):
+    """Set numpy arrays read-only so that cached data can't be modified."""
+    if hasattr(obj, 'flags') and hasattr(obj.flags, 'writeable'):
+        obj.flags.writeable = False
+    elif isinstance(obj, dict):
+        for v in obj.values():
+            _freeze(v)
+    elif isinstance(obj, (list, tuple)):
+        for v in obj:
+            _freeze(v)
+    return obj
+
+
+def _copy(obj):
+    """Copy a cached object, sharing its read-only numpy arrays."""
+    if hasattr(obj, 'flags') and hasattr(obj.flags, 'writeable'):
+        return obj if not obj.flags.writeable else obj.copy()
+    if hasattr(obj, 'memory_usage') and hasattr(obj, 'copy'):  # pandas
+        return obj.copy(deep=True)
+    if isinstance(obj, dict):
+        return type(obj)((k, _copy(v)) for k, v in obj.items())
+    if isinstance(obj, list):
+        return [_copy(k) for k in obj]
+    if isinstance(obj, tuple):
+        return tuple([_copy(k) for k in obj])
+    return deepcopy(obj)
+
+
+class LoadCache(object):
+    """Byte-budgeted LRU cache of loaded files.
+
+    Entries are keyed by (path, modification time, size) so that a file
+    modified on disk is loaded again. When the memory budget is exceeded,
+    the least recently used entries are evicted.
+
+    Cached numpy arrays are read-only and shared with the caller, the rest
+    of the data (containers, DataFrames, etc.) is copied at each hit so that
+    the cached data can't be modified by the caller. Files returned
+    open (e.g .npz and HDF5 files) are not cached.
+
+    Parameters
+    ----------
+    max_bytes : int | 256e6
+        Memory budget of the cache (in bytes).
+    """
+
+    def __init__(self, max_bytes=256e6):  # noqa
+        self.max_bytes = int(max_bytes)
+        self._entries = OrderedDict()
+        self._lock = RLock()
+        self._currsize = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, path, loader, *args, **kwargs):
+        """Get a file from the cache or load it.
+
+        Parameters
+        ----------
+        path : string
+            Full path to the file.
+        loader : callable
+            Function used to load the file (called with
+            `loader(path, *args, **kwargs)`) in case of a cache miss.
+
+        Returns
+        -------
+        arch
+            The loaded file.
+        """
+        path = os.path.realpath(path)
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(path)
+            if (entry is not None) and (entry[0] == key):
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return self._output(path, entry[1])
+            self.misses += 1
+        arch = loader(path, *args, **kwargs)
+        if hasattr(arch, 'close'):  # open file (e.g .npz or HDF5)
+            return arch
+        nbytes = sizeof(arch)
+        if nbytes > self.max_bytes:
+            logger.debug("    %s is too large to be cached" % path)
+            return arch
+        with self._lock:
+            self._pop(path)
+            self._entries[path] = (key, _freeze(arch), nbytes)
+            self._currsize += nbytes
+            while self._currsize > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+        return self._output(path, arch)
+
+    def invalidate(self, path):
+        """Remove a file from the cache.
+
+        Parameters
+        ----------
+        path : string
+            Full path to the file.
+        """
+        with self._lock:
+            self._pop(os.path.realpath(path))
+
+    def clear(self):
+        """Remove every entry of the cache and reset statistics."""
+        with self._lock:
+            self._entries.clear()
+            self._currsize = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def info(self):
+        """Get the statistics of the cache.
+
+        Returns
+        -------
+        info : dict
+            Dictionary with the number of hits, misses, evictions and cached
+            entries, the current size and the budget (in bytes).
+        """
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses,
+                        evictions=self.evictions,
+                        entries=len(self._entries), currsize=self._currsize,
+                        max_bytes=self.max_bytes)
+
+    def _pop(self, path):
+        """Remove an entry."""
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self._currsize -= entry[2]
+
+    @staticmethod
+    def _output(path, arch):
+        """Copy the cached data (except read-only arrays)."""
+        return _copy(arch)
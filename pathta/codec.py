@@ -0,0 +1,122 @@
+"""Chunked and multithreaded compression of files."""
+import zlib
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+from pathta.parallel import get_n_jobs
+
+
+MAGIC = b'PTHC'
+VERSION = 1
+CODECS = ('zlib', 'zstd', 'lz4')
+CHUNKSIZE = 4 * 1024 * 1024
+DEFAULT_LEVEL = dict(zlib=6, zstd=3, lz4=0)
+_HEADER = struct.Struct('<4sBBQI')  # magic, version, codec, size, n_chunks
+
+
+def _get_codec(codec, level=None):
+    """Get the (compress, decompress) functions of a codec."""
+    if codec not in CODECS:
+        raise ValueError("codec should be in %s" % ', '.join(CODECS))
+    level = DEFAULT_LEVEL[codec] if level is None else level
+    if codec == 'zlib':
+        return (lambda x: zlib.compress(x, level)), zlib.decompress
+    elif codec == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("The zstd codec requires the zstandard package "
+                              "(pip install zstandard)")
+        return (lambda x: zstandard.ZstdCompressor(level=level).compress(x),
+                lambda x: zstandard.ZstdDecompressor().decompress(x))
+    else:
+        try:
+            import lz4.frame
+        except ImportError:
+            raise ImportError("The lz4 codec requires the lz4 package (pip "
+                              "install lz4)")
+        return (lambda x: lz4.frame.compress(x, compression_level=level),
+                lz4.frame.decompress)
+
+
+def compress(data, codec='zstd', level=None, n_jobs=None,
+             chunksize=CHUNKSIZE):
+    """Compress bytes, chunk by chunk, on a pool of threads.
+
+    Parameters
+    ----------
+    data : bytes-like
+        Data to compress.
+    codec : {'zstd', 'lz4', 'zlib'}
+        Compression codec. 'zstd' and 'lz4' require the zstandard and lz4
+        packages.
+    level : int | None
+        Compression level (codec dependent). By default, 3 for zstd, 0 for
+        lz4 and 6 for zlib.
+    n_jobs : int | None
+        Number of threads. By default, all of the CPUs are used.
+    chunksize : int | 4MB
+        Size of the chunks compressed independently.
+
+    Returns
+    -------
+    compressed : bytes
+        Compressed data, with a header describing the codec and the chunks.
+    """
+    fcn, _ = _get_codec(codec, level)
+    data = memoryview(data).cast('B')
+    chunks = [data[k:k + chunksize] for k in range(0, len(data), chunksize)]
+    n_jobs = min(get_n_jobs(n_jobs), max(len(chunks), 1))
+    if n_jobs == 1:
+        blocks = [fcn(k) for k in chunks]
+    else:
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            blocks = list(executor.map(fcn, chunks))
+    header = _HEADER.pack(MAGIC, VERSION, CODECS.index(codec), len(data),
+                          len(blocks))
+    sizes = struct.pack('<%iQ' % len(blocks), *[len(k) for k in blocks])
+    return b''.join([header, sizes] + blocks)
+
+
+def decompress(data, n_jobs=None):
+    """Decompress bytes compressed with :func:`compress`.
+
+    Parameters
+    ----------
+    data : bytes-like
+        Compressed data.
+    n_jobs : int | None
+        Number of threads. By default, all of the CPUs are used.
+
+    Returns
+    -------
+    data : bytes
+        Decompressed data.
+    """
+    data = memoryview(data)
+    magic, version, codec, size, n_chunks = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise IOError("Data not compressed with pathta")
+    _, fcn = _get_codec(CODECS[codec])
+    start = _HEADER.size
+    sizes = struct.unpack_from('<%iQ' % n_chunks, data, start)
+    start += 8 * n_chunks
+    blocks = []
+    for k in sizes:
+        blocks.append(data[start:start + k])
+        start += k
+    n_jobs = min(get_n_jobs(n_jobs), max(n_chunks, 1))
+    if n_jobs == 1:
+        out = [fcn(k) for k in blocks]
+    else:
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            out = list(executor.map(fcn, blocks))
+    out = b''.join(out)
+    assert len(out) == size, "Corrupted compressed data"
+    return out
+
+
+def is_compressed(name):
+    """Check if a file has been compressed with :func:`compress`."""
+    with open(name, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
@@ -0,0 +1,134 @@
+"""Persistent index of the files contained in the folders of a study."""
+import os
+import sqlite3
+import logging
+from threading import RLock
+
+
+logger = logging.getLogger('pathta')
+
+INDEX_FILE = 'index.sqlite'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    folder TEXT PRIMARY KEY,
+    mtime INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    folder TEXT NOT NULL,
+    name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_folder ON files (folder);
+"""
+
+
+class FileIndex(object):
+    """SQLite index of the files of a study.
+
+    The content of a folder is only listed again when the modification time
+    of this folder changed. Otherwise, the list of files is directly read from
+    the database.
+
+    Parameters
+    ----------
+    root : string
+        Path to the root folder of the study.
+    db_path : string | None
+        Path to the SQLite database. By default, the database is stored
+        inside the cache/ folder of the study.
+    """
+
+    def __init__(self, root, db_path=None):  # noqa
+        self.root = root
+        if not isinstance(db_path, str):
+            db_path = os.path.join(root, 'cache', INDEX_FILE)
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self._lock = RLock()
+        self._conn = sqlite3.connect(db_path, timeout=30.,
+                                     check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.executescript(_SCHEMA)
+
+    def listdir(self, folder=''):
+        """Get the list of files in a folder.
+
+        Parameters
+        ----------
+        folder : string | ''
+            Folder relative to the root of the study.
+
+        Returns
+        -------
+        files : list
+            List of file names.
+        """
+        folder = self._normalize(folder)
+        mtime = os.stat(os.path.join(self.root, folder)).st_mtime_ns
+        with self._lock:
+            row = self._conn.execute("SELECT mtime FROM dirs WHERE folder=?",
+                                     (folder,)).fetchone()
+            if (row is None) or (row[0] != mtime):
+                return self._update(folder, mtime)
+            rows = self._conn.execute("SELECT name FROM files WHERE "
+                                      "folder=? ORDER BY rowid", (folder,))
+            return [k[0] for k in rows]
+
+    def reindex(self, folder=None):
+        """Force the update of the index.
+
+        Parameters
+        ----------
+        folder : string | None
+            Folder to re-index. If None, all of the indexed folders are
+            listed again.
+        """
+        with self._lock:
+            if isinstance(folder, str):
+                folders = [self._normalize(folder)]
+            else:
+                rows = self._conn.execute("SELECT folder FROM dirs")
+                folders = [k[0] for k in rows]
+            for k in folders:
+                path = os.path.join(self.root, k)
+                if os.path.isdir(path):
+                    self._update(k, os.stat(path).st_mtime_ns)
+                else:
+                    self._drop(k)
+        logger.info("    %i folders re-indexed" % len(folders))
+
+    def clear(self):
+        """Remove every entry of the index."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM files")
+            self._conn.execute("DELETE FROM dirs")
+
+    def close(self):
+        """Close the connection to the database."""
+        with self._lock:
+            self._conn.close()
+
+    def _update(self, folder, mtime):
+        """List a folder and store its content."""
+        files = os.listdir(os.path.join(self.root, folder))
+        with self._conn:
+            self._conn.execute("DELETE FROM files WHERE folder=?", (folder,))
+            self._conn.executemany("INSERT INTO files (folder, name) VALUES "
+                                   "(?, ?)", [(folder, k) for k in files])
+            self._conn.execute("INSERT OR REPLACE INTO dirs (folder, mtime) "
+                               "VALUES (?, ?)", (folder, mtime))
+        logger.debug("    Folder '%s' indexed (%i files)" % (folder,
+                                                            len(files)))
+        return files
+
+    def _drop(self, folder):
+        """Remove a folder from the index."""
+        with self._conn:
+            self._conn.execute("DELETE FROM files WHERE folder=?", (folder,))
+            self._conn.execute("DELETE FROM dirs WHERE folder=?", (folder,))
+
+    @staticmethod
+    def _normalize(folder):
+        """Normalize the name of a folder."""
+        folder = os.path.normpath(folder)
+        return '' if folder == '.' else folder
@@ -0,0 +1,155 @@
+"""Statistics of the I/O operations (bytes, calls and latencies).
+
+Statistics are disabled by default. They are collected per process, per
+operation ('load', 'save' or 'search'), per extension and per folder, once
+enabled with :func:`enable` (or with the `PATHTA_IOSTATS=1` environment
+variable).
+"""
+import os
+import json
+import time
+from bisect import bisect_right
+from functools import wraps
+from threading import Lock
+
+
+ENABLED = os.environ.get('PATHTA_IOSTATS', '0') not in ('', '0')
+HIST_BOUNDS = (1e-4, 1e-3, 1e-2, 1e-1, 1., 10.)
+HIST_LABELS = ('<0.1ms', '<1ms', '<10ms', '<100ms', '<1s', '<10s', '>=10s')
+PARTIAL_KWARGS = ('lazy', 'mmap_mode', 'variables', 'columns', 'filters',
+                  'chunksize', 'slices')
+
+_STATS = {}
+_LOCK = Lock()
+
+
+def enable(flag=True):
+    """Enable (or disable) the collection of statistics."""
+    global ENABLED
+    ENABLED = bool(flag)
+
+
+def record(op, path, nbytes, elapsed):
+    """Record an I/O operation.
+
+    Parameters
+    ----------
+    op : string
+        Name of the operation ('load', 'save' or 'search').
+    path : string
+        Path to the file (or to the searched folder).
+    nbytes : int | None
+        Number of bytes read or written. Use None for partial or deferred
+        reads (e.g lazy loads), counted in the 'partial' column with 0
+        bytes.
+    elapsed : float
+        Duration of the operation (in seconds).
+    """
+    folder, file = os.path.split(path)
+    key = (op, os.path.splitext(file)[1].lower(), folder)
+    with _LOCK:
+        stats = _STATS.get(key)
+        if stats is None:
+            stats = _STATS[key] = dict(calls=0, partial=0, bytes=0, time=0.,
+                                       hist=[0] * len(HIST_LABELS))
+        stats['calls'] += 1
+        if nbytes is None:
+            stats['partial'] += 1
+        else:
+            stats['bytes'] += nbytes
+        stats['time'] += elapsed
+        stats['hist'][bisect_right(HIST_BOUNDS, elapsed)] += 1
+
+
+def timed(op, get_path):
+    """Decorator recording the calls of a function while enabled.
+
+    Parameters
+    ----------
+    op : string
+        Name of the operation.
+    get_path : callable
+        Function `get_path(args, kwargs, out)` returning the (path, nbytes)
+        of a call from its arguments and output.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            out = func(*args, **kwargs)
+            elapsed = time.perf_counter() - start
+            try:
+                record(op, *get_path(args, kwargs, out), elapsed)
+            except OSError:  # e.g file removed in the meantime
+                pass
+            return out
+        return wrapper
+    return decorator
+
+
+def input_file(args, kwargs, out):
+    """Get the (path, size) of a file given as first argument.
+
+    The size is None when only a part of the file is read (selection of
+    variables, columns, rows or slices) or when the data is read later
+    (lazy or memory-mapped loads, iterators and open files).
+    """
+    name = args[0] if len(args) else kwargs['name']
+    if hasattr(out, 'close') or any([kwargs.get(k) not in [None, False] for
+                                     k in PARTIAL_KWARGS]):
+        return name, None
+    return name, os.path.getsize(name)
+
+
+def output_file(args, kwargs, out):
+    """Get the (path, size) of a file returned by a function."""
+    return out, os.path.getsize(out)
+
+
+def get_stats(reset=False):
+    """Get the collected statistics.
+
+    Parameters
+    ----------
+    reset : bool | False
+        Reset the statistics after reading them.
+
+    Returns
+    -------
+    stats : list
+        List of dictionaries (one per operation, extension and folder) with
+        the number of calls (and of partial reads among them), the number
+        of bytes, the total and mean time (in seconds) and the number of
+        calls in each latency bin. Partial reads don't count any byte.
+    """
+    with _LOCK:
+        items = [(k, dict(v, hist=list(v['hist']))) for k, v in
+                 _STATS.items()]
+        if reset:
+            _STATS.clear()
+    out = []
+    for (op, ext, folder), stats in sorted(items):
+        row = dict(op=op, ext=ext, folder=folder, calls=stats['calls'],
+                   partial=stats['partial'], bytes=stats['bytes'],
+                   time=stats['time'],
+                   time_mean=stats['time'] / stats['calls'])
+        row.update(zip(HIST_LABELS, stats['hist']))
+        out.append(row)
+    return out
+
+
+def export(stats, filename):
+    """Export statistics to a .json or a .csv file."""
+    if filename.endswith('.csv'):
+        import csv
+        columns = ['op', 'ext', 'folder', 'calls', 'partial', 'bytes',
+                   'time', 'time_mean'] + list(HIST_LABELS)
+        with open(filename, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(stats)
+    else:
+        with open(filename, 'w') as f:
+            json.dump(stats, f, indent=4)
@@ -0,0 +1,53 @@
+"""Advisory file locking shared by processes."""
+import os
+import errno
+import logging
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+logger = logging.getLogger('pathta')
+
+_UNSUPPORTED = (errno.ENOLCK, errno.ENOSYS, errno.EOPNOTSUPP)
+
+
+@contextmanager
+def file_lock(path, shared=False):
+    """Lock a file across processes.
+
+    The lock is taken on a `<path>.lock` companion file so that the locked
+    file itself can be atomically replaced while the lock is held. On
+    systems without `fcntl` (or file systems without locks), no lock is
+    taken.
+
+    Parameters
+    ----------
+    path : string
+        Path to the file to lock.
+    shared : bool | False
+        Take a shared (read) lock instead of an exclusive (write) lock.
+    """
+    if fcntl is None:
+        yield
+        return
+    fd = os.open(path + '.lock', os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        except OSError as exc:
+            # e.g Lustre mounted without the flock option
+            if exc.errno not in _UNSUPPORTED:
+                raise
+            logger.debug("    File locks not supported for %s" % path)
+        yield
+    finally:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
@@ -0,0 +1,227 @@
+"""Manifest of the files of a folder and synchronization of folders."""
+import os
+import json
+import shutil
+import hashlib
+import logging
+
+from pathta.rwio import tmp_name, is_temporary
+from pathta.walk import scan_tree
+from pathta.parallel import bounded_map
+from pathta.sharedfs import makedirs
+
+
+logger = logging.getLogger('pathta')
+
+BLOCKSIZE = 1024 * 1024
+COPY_CHUNK = 64 * 1024 * 1024
+MANIFEST_FILE = os.path.join('cache', 'manifest.json')
+
+
+def hash_file(path, blocksize=BLOCKSIZE):
+    """Get the sha256 hash of the content of a file."""
+    h = hashlib.sha256()
+    buf = bytearray(blocksize)
+    view = memoryview(buf)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            h.update(view[:n])
+    return h.hexdigest()
+
+
+def load_manifest(root):
+    """Load the manifest stored in a folder (empty if there is none)."""
+    try:
+        with open(os.path.join(root, MANIFEST_FILE), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_manifest(root, manifest):
+    """Atomically save the manifest of a folder."""
+    name = os.path.join(makedirs(os.path.join(root, 'cache')),
+                        os.path.basename(MANIFEST_FILE))
+    tmp = tmp_name(name)
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=0, sort_keys=True)
+    os.replace(tmp, name)
+
+
+def _list_files(root, exclude):
+    """List the files of a folder, skipping the sub-folders of the root
+    named in `exclude` (folders of the same name deeper are kept)."""
+    files = []
+    with os.scandir(root) as it:
+        entries = [(k.name, k.is_dir()) for k in it]
+    for name, is_dir in entries:
+        if not is_dir:
+            files.append(name)
+        elif name not in exclude:
+            files += [os.path.join(name, k) for k in scan_tree(
+                os.path.join(root, name))]
+    return files
+
+
+def build_manifest(root, previous=None, exclude=('cache',), n_jobs=None):
+    """Get the size, modification time and hash of the files of a folder.
+
+    Parameters
+    ----------
+    root : string
+        Path to the folder.
+    previous : dict | None
+        Previous manifest of the folder. The hash of the files whose size
+        and modification time didn't change is reused.
+    exclude : tuple | ('cache',)
+        Names of the sub-folders of the root folder to skip (deeper
+        folders with the same name are kept).
+    n_jobs : int | None
+        Number of threads hashing files. By default, all of the CPUs.
+
+    Returns
+    -------
+    manifest : dict
+        Dictionary {relative path: {'size', 'mtime_ns', 'sha256'}}.
+    """
+    previous = previous or {}
+    files = [k for k in _list_files(root, exclude) if not is_temporary(k)]
+
+    def _entry(file):
+        try:
+            stat = os.stat(os.path.join(root, file))
+        except FileNotFoundError:  # removed in the meantime
+            return file, None
+        file = file.replace(os.sep, '/')
+        entry = dict(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        old = previous.get(file, {})
+        if (old.get('size'), old.get('mtime_ns')) == (entry['size'],
+                                                      entry['mtime_ns']):
+            entry['sha256'] = old['sha256']
+        else:
+            entry['sha256'] = hash_file(os.path.join(root, file))
+        return file, entry
+
+    manifest = {}
+    for file, entry in bounded_map(_entry, files, n_jobs=n_jobs):
+        if entry is not None:
+            manifest[file] = entry
+    return manifest
+
+
+def _copy_range(fsrc, fdst, size):
+    """Copy the content of a file inside the kernel when possible."""
+    src, dst, offset = fsrc.fileno(), fdst.fileno(), 0
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while offset < size:
+                n = os.copy_file_range(src, dst, min(COPY_CHUNK,
+                                                     size - offset))
+                if n == 0:
+                    break
+                offset += n
+            return offset
+        except OSError:  # e.g across file systems on old kernels
+            if offset:
+                raise
+    if hasattr(os, 'sendfile'):
+        try:
+            while offset < size:
+                n = os.sendfile(dst, src, offset, min(COPY_CHUNK,
+                                                      size - offset))
+                if n == 0:
+                    break
+                offset += n
+            os.lseek(dst, offset, os.SEEK_SET)
+            return offset
+        except OSError:
+            if offset:
+                raise
+    shutil.copyfileobj(fsrc, fdst, COPY_CHUNK)
+    return size
+
+
+def copy_file(src, dst):
+    """Atomically copy a file, keeping its modification time.
+
+    The file is copied to a temporary file of the destination folder
+    (using copy_file_range or sendfile when available), which is then
+    renamed.
+
+    Parameters
+    ----------
+    src : string
+        Path to the file to copy.
+    dst : string
+        Path to the destination file.
+    """
+    makedirs(os.path.dirname(dst))
+    tmp = tmp_name(dst)
+    try:
+        with open(src, 'rb') as fsrc, open(tmp, 'wb') as fdst:
+            stat = os.fstat(fsrc.fileno())
+            _copy_range(fsrc, fdst, stat.st_size)
+        shutil.copymode(src, tmp)
+        os.utime(tmp, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(tmp, dst)
+    except BaseException:
+        if os.path.isfile(tmp):
+            os.remove(tmp)
+        raise
+
+
+def sync(src_root, dst_root, delete=False, exclude=('cache',),
+         n_jobs=None):
+    """Copy the files of a folder which differ in another folder.
+
+    The manifests of both folders are updated (only modified files are
+    hashed again) and compared : files that are missing or whose content
+    differs in the destination are copied, in parallel.
+
+    Parameters
+    ----------
+    src_root : string
+        Path to the source folder.
+    dst_root : string
+        Path to the destination folder.
+    delete : bool | False
+        Remove the files of the destination which don't exist in the
+        source.
+    exclude : tuple | ('cache',)
+        Names of the sub-folders of the root folder to skip (deeper
+        folders with the same name are kept).
+    n_jobs : int | None
+        Number of threads. By default, all of the CPUs.
+
+    Returns
+    -------
+    report : dict
+        Lists of the 'copied', 'deleted' and 'unchanged' files.
+    """
+    src = build_manifest(src_root, load_manifest(src_root), exclude=exclude,
+                         n_jobs=n_jobs)
+    save_manifest(src_root, src)
+    makedirs(dst_root)
+    dst = build_manifest(dst_root, load_manifest(dst_root), exclude=exclude,
+                         n_jobs=n_jobs)
+    to_copy = sorted([k for k, v in src.items() if (k not in dst) or (
+        dst[k]['sha256'] != v['sha256'])])
+    to_delete = sorted([k for k in dst if k not in src]) if delete else []
+
+    def _copy(file):
+        copy_file(os.path.join(src_root, file), os.path.join(dst_root, file))
+        return file
+
+    for file in bounded_map(_copy, to_copy, n_jobs=n_jobs):
+        # mtimes are preserved, so that the entry stays valid
+        dst[file] = dict(src[file])
+        logger.debug("    %s copied" % file)
+    for file in to_delete:
+        os.remove(os.path.join(dst_root, file))
+        dst.pop(file)
+    save_manifest(dst_root, dst)
+    unchanged = sorted(set(src) - set(to_copy))
+    return dict(copied=to_copy, deleted=to_delete, unchanged=unchanged)
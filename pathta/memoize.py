@@ -0,0 +1,198 @@
+"""Cache the outputs of functions on disk."""
+import os
+import time
+import pickle
+import hashlib
+import inspect
+import logging
+from functools import wraps
+
+import numpy as np
+
+from pathta.rwio import tmp_name, is_temporary
+
+
+logger = logging.getLogger('pathta')
+
+
+def _update_hash(h, obj):
+    """Recursively feed an object to a hash (numpy arrays by content)."""
+    if isinstance(obj, np.ndarray):
+        h.update(b'ndarray')
+        h.update(str((obj.dtype.str, obj.shape)).encode())
+        if obj.dtype.hasobject:
+            h.update(pickle.dumps(obj.tolist(), protocol=4))
+        else:
+            h.update(np.ascontiguousarray(obj).view(np.uint8).data)
+    elif isinstance(obj, dict):
+        h.update(b'dict')
+        for k in sorted(obj, key=repr):
+            _update_hash(h, k)
+            _update_hash(h, obj[k])
+    elif isinstance(obj, (list, tuple)):
+        h.update(type(obj).__name__.encode())
+        for k in obj:
+            _update_hash(h, k)
+    elif isinstance(obj, (set, frozenset)):
+        # the iteration order of sets depends on the hash seed of the process
+        h.update(type(obj).__name__.encode())
+        for k in sorted([_digest(k) for k in obj]):
+            h.update(k)
+    else:
+        h.update(pickle.dumps(obj, protocol=4))
+
+
+def _digest(obj):
+    """Get the hash of a single object."""
+    h = hashlib.sha256()
+    _update_hash(h, obj)
+    return h.digest()
+
+
+def source_digest(func):
+    """Get the hash of the source code of a function."""
+    try:
+        source = inspect.getsource(func)
+    except (OSError, TypeError):
+        source = func.__code__.co_code
+    source = source.encode() if isinstance(source, str) else source
+    return hashlib.sha256(source).digest()
+
+
+def _is_output(name):
+    """Stored outputs (not the temporary files being written)."""
+    return name.endswith('.pickle') and not is_temporary(name)
+
+
+def hash_call(func, args, kwargs, source=None):
+    """Get the key of a function call.
+
+    The key is built from the source code of the function and the values of
+    its arguments (numpy arrays are hashed by content).
+
+    Parameters
+    ----------
+    func : callable
+        The function.
+    args, kwargs :
+        Arguments of the call.
+    source : bytes | None
+        Hash of the source code of the function (see :func:`source_digest`).
+        By default, it is computed from the function.
+
+    Returns
+    -------
+    key : string
+        Hexadecimal key of the call.
+    """
+    h = hashlib.sha256()
+    h.update(source_digest(func) if source is None else source)
+    try:
+        bound = inspect.signature(func).bind(*args, **kwargs)
+        bound.apply_defaults()
+        args, kwargs = (), bound.arguments
+    except (TypeError, ValueError):
+        pass
+    _update_hash(h, (tuple(args), dict(kwargs)))
+    return h.hexdigest()
+
+
+class DiskMemoize(object):
+    """Decorator storing the outputs of a function on disk.
+
+    Outputs are pickled into a folder shared by every process having access
+    to it, so that a call with the same arguments (and the same function
+    source code) is only computed once.
+
+    Parameters
+    ----------
+    path : string
+        Folder where outputs are stored.
+    max_bytes : int | None
+        Maximum size of the stored outputs. Least recently used outputs are
+        removed when it is exceeded.
+    max_age : float | None
+        Maximum age (in seconds) of the stored outputs since their last use.
+    """
+
+    def __init__(self, path, max_bytes=None, max_age=None):  # noqa
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+    def __call__(self, func):
+        """Decorate a function."""
+        name = '%s.%s' % (func.__module__, func.__qualname__)
+        name = name.replace('<', '').replace('>', '')
+        source = source_digest(func)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = hash_call(func, args, kwargs, source=source)
+            file = os.path.join(self.path, '%s-%s.pickle' % (name, key[0:32]))
+            try:
+                with open(file, 'rb') as f:
+                    out = pickle.load(f)
+                os.utime(file)
+                logger.debug("    %s loaded from the cache" % name)
+                return out
+            except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+                pass
+            out = func(*args, **kwargs)
+            tmp = tmp_name(file)
+            try:
+                with open(tmp, 'wb') as f:
+                    pickle.dump(out, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, file)
+            except BaseException:
+                if os.path.isfile(tmp):
+                    os.remove(tmp)
+                raise
+            self.evict()
+            return out
+        wrapper.cache = self
+        return wrapper
+
+    def evict(self):
+        """Remove outputs that are too old or exceed the size budget."""
+        if (self.max_bytes is None) and (self.max_age is None):
+            return
+        entries = []
+        with os.scandir(self.path) as it:
+            for entry in it:
+                if not _is_output(entry.name):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:  # removed by another process
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        now, removed = time.time(), []
+        if self.max_age is not None:
+            removed += [k for k in entries if now - k[0] > self.max_age]
+            entries = [k for k in entries if now - k[0] <= self.max_age]
+        if self.max_bytes is not None:
+            total = sum([k[1] for k in entries])
+            while len(entries) and (total > self.max_bytes):
+                total -= entries[0][1]
+                removed.append(entries.pop(0))
+        for _, _, file in removed:
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                pass
+        if len(removed):
+            logger.debug("    %i cached outputs removed" % len(removed))
+
+    def clear(self):
+        """Remove every stored output."""
+        with os.scandir(self.path) as it:
+            for entry in it:
+                if not _is_output(entry.name):
+                    continue
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
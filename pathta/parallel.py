@@ -0,0 +1,157 @@
+"""Run functions concurrently on threads or processes."""
+import os
+from functools import partial
+from threading import Condition
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+BACKENDS = dict(thread=ThreadPoolExecutor, process=ProcessPoolExecutor)
+
+
+def get_n_jobs(n_jobs=None):
+    """Get the number of workers (-1 or None means all of the CPUs)."""
+    n_cpus = os.cpu_count() or 1
+    if (n_jobs is None) or (n_jobs == -1):
+        return n_cpus
+    assert isinstance(n_jobs, int) and (n_jobs >= 1)
+    return n_jobs
+
+
+def bounded_map(fcn, items, n_jobs=None, backend='thread',
+                max_in_flight=None):
+    """Apply a function to items concurrently, preserving their order.
+
+    Contrary to `Executor.map`, items are submitted progressively so that at
+    most `max_in_flight` results are pending (or waiting to be consumed) at
+    any time. This bounds the memory used when results are large.
+
+    Parameters
+    ----------
+    fcn : callable
+        Function to apply to each item. It should be picklable when using
+        the 'process' backend.
+    items : iterable
+        Items to process.
+    n_jobs : int | None
+        Number of workers. By default, all of the CPUs are used. Use 1 to
+        run sequentially.
+    backend : {'thread', 'process'}
+        Use a pool of threads or processes.
+    max_in_flight : int | None
+        Maximum number of submitted items whose results are not yet
+        consumed. By default, twice the number of workers.
+
+    Yields
+    ------
+    result
+        The output of `fcn(item)`, in the order of items.
+    """
+    if backend not in BACKENDS:
+        raise ValueError("backend should be in %s" % ', '.join(BACKENDS))
+    n_jobs = get_n_jobs(n_jobs)
+    if n_jobs == 1:
+        for item in items:
+            yield fcn(item)
+        return
+    if max_in_flight is None:
+        max_in_flight = 2 * n_jobs
+    assert max_in_flight >= 1
+    items, pending = iter(items), deque()
+    with BACKENDS[backend](max_workers=n_jobs) as executor:
+        try:
+            for item in items:
+                pending.append(executor.submit(fcn, item))
+                if len(pending) >= max_in_flight:
+                    yield pending.popleft().result()
+            while len(pending):
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+class BackgroundWriter(object):
+    """Bounded pool of threads running write operations in the background.
+
+    Submitting a write blocks as long as the pending writes already hold
+    more than `max_bytes`, which caps the memory retained by the pool.
+
+    Parameters
+    ----------
+    n_jobs : int | 2
+        Number of writing threads.
+    max_bytes : int | 1e9
+        Maximum number of bytes pending to be written. A single write larger
+        than this budget is accepted once every previous write is done.
+    """
+
+    def __init__(self, n_jobs=2, max_bytes=1e9):  # noqa
+        self.max_bytes = int(max_bytes)
+        self._executor = ThreadPoolExecutor(max_workers=n_jobs)
+        self._cond = Condition()
+        self._pending_bytes = 0
+        self._futures = set()
+
+    def submit(self, fcn, nbytes, *args, **kwargs):
+        """Submit a write operation.
+
+        Parameters
+        ----------
+        fcn : callable
+            Function performing the write.
+        nbytes : int
+            Number of bytes held by the write.
+        args, kwargs :
+            Arguments passed to `fcn`.
+
+        Returns
+        -------
+        future : concurrent.futures.Future
+            Future of the write operation.
+        """
+        with self._cond:
+            while self._pending_bytes and (
+                    self._pending_bytes + nbytes > self.max_bytes):
+                self._cond.wait()
+            self._pending_bytes += nbytes
+            future = self._executor.submit(fcn, *args, **kwargs)
+            self._futures.add(future)
+        future.add_done_callback(partial(self._release, nbytes))
+        return future
+
+    def flush(self):
+        """Wait for every pending write.
+
+        Returns
+        -------
+        errors : list
+            List of (future, exception) of the failed writes.
+        """
+        with self._cond:
+            futures = list(self._futures)
+        errors = []
+        for future in futures:
+            exc = None if future.cancelled() else future.exception()
+            if exc is not None:
+                errors.append((future, exc))
+        with self._cond:
+            self._futures.difference_update(futures)
+        return errors
+
+    @property
+    def pending_bytes(self):
+        """Get the number of bytes pending to be written."""
+        return self._pending_bytes
+
+    def shutdown(self, wait=True):
+        """Shutdown the pool of threads."""
+        self._executor.shutdown(wait=wait)
+
+    def _release(self, nbytes, future):
+        """Release the memory budget of a finished write."""
+        with self._cond:
+            self._pending_bytes -= nbytes
+            if future.cancelled() or (future.exception() is None):
+                self._futures.discard(future)
+            self._cond.notify_all()
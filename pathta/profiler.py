@@ -0,0 +1,200 @@
+"""Nested timers recording the wall time, CPU time and memory of stages."""
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from functools import wraps
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from pathta.syslog import PROFILER_LEVEL_NUM
+
+
+logger = logging.getLogger('pathta')
+
+RUN_ID = '%s-%i' % (datetime.now().strftime('%Y%m%d%H%M%S'), os.getpid())
+_STACK = threading.local()
+_WRITE_LOCK = threading.Lock()
+
+
+def peak_rss():
+    """Get the peak resident memory of the process since it started (in MB).
+
+    None on systems without the `resource` module.
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / (1024. ** 2 if sys.platform == 'darwin' else 1024.)
+
+
+def current_rss():
+    """Get the current resident memory of the process (in MB).
+
+    Read from /proc on Linux, or with psutil (if installed) on other
+    systems. None if it can't be measured.
+    """
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1024. ** 2
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss / 1024. ** 2
+
+
+def _stack():
+    """Get the running timers of the thread."""
+    if not hasattr(_STACK, 'timers'):
+        _STACK.timers = []
+    return _STACK.timers
+
+
+def write_record(path, record):
+    """Append a record to a JSONL file."""
+    line = json.dumps(record) + '\n'
+    with _WRITE_LOCK, open(path, 'a') as f:
+        f.write(line)
+
+
+class Timer(object):
+    """Named timer, usable as a context manager or as a decorator.
+
+    Timers can be nested : the stage of a timer started inside another one
+    is named 'parent/child'. Nesting is tracked per thread.
+
+    Parameters
+    ----------
+    name : string
+        Name of the stage.
+    path : string | None
+        JSONL file where records are appended. If None, records are only
+        logged (at the PROFILER level).
+
+    Attributes
+    ----------
+    record : dict | None
+        The record of the last timed stage : stage, wall and CPU times (in
+        seconds), resident memory of the process at the start and at the
+        end of the stage ('rss_start' and 'rss_end', in MB) and peak
+        resident memory of the process since it started
+        ('process_peak_rss', in MB).
+    """
+
+    def __init__(self, name, path=None):  # noqa
+        self.name = name
+        self.path = path
+        self.record = None
+
+    def __enter__(self):  # noqa
+        stack = _stack()
+        stack.append(self)
+        self._stage = '/'.join([k.name for k in stack])
+        self._start = datetime.now()
+        self._rss = current_rss()
+        self._cpu = time.process_time()
+        self._wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *args):  # noqa
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        stack = _stack()
+        # remove this timer, even if timers started after it are still
+        # running (e.g toggled timers)
+        for k in range(len(stack) - 1, -1, -1):
+            if stack[k] is self:
+                del stack[k]
+                break
+        self.record = dict(
+            run=RUN_ID, script=sys.argv[0], stage=self._stage,
+            start=self._start.isoformat(), wall=wall, cpu=cpu,
+            rss_start=self._rss, rss_end=current_rss(),
+            process_peak_rss=peak_rss(), failed=exc_type is not None)
+        logger.log(PROFILER_LEVEL_NUM, "    %s : %.3fs (cpu %.3fs)",
+                   self._stage, wall, cpu)
+        if self.path is not None:
+            write_record(self.path, self.record)
+
+    def __call__(self, func):
+        """Decorate a function."""
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with Timer(self.name, path=self.path):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def load_records(path):
+    """Load the records of a JSONL file (skipping truncated lines)."""
+    records = []
+    if not os.path.isfile(path):
+        return records
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                pass
+    return records
+
+
+def profile_report(path, script=None, last=None):
+    """Summarise the timings of the stages recorded in a JSONL file.
+
+    Parameters
+    ----------
+    path : string
+        JSONL file of records.
+    script : string | None
+        Only use the records of a script.
+    last : int | None
+        Only use the records of the `last` runs.
+
+    Returns
+    -------
+    report : pandas.DataFrame
+        Statistics of each (script, stage) : number of runs and calls, total,
+        mean, min and max wall time, mean CPU time, maximum memory growth
+        during the stage ('rss_delta_max', end minus start resident memory)
+        and maximum peak memory of the process ('process_peak_rss'). Memory
+        is in MB. Stages are sorted by decreasing total wall time.
+    """
+    import pandas as pd
+
+    columns = ['script', 'stage', 'n_runs', 'n_calls', 'wall_total',
+               'wall_mean', 'wall_min', 'wall_max', 'cpu_mean',
+               'rss_delta_max', 'process_peak_rss']
+    df = pd.DataFrame(load_records(path))
+    if not len(df):
+        return pd.DataFrame(columns=columns)
+    for k in ['rss_start', 'rss_end', 'process_peak_rss']:
+        df[k] = pd.to_numeric(df[k], errors='coerce') if k in df else (
+            float('nan'))
+    df['rss_delta'] = df['rss_end'] - df['rss_start']
+    if isinstance(script, str):
+        df = df[df['script'] == script]
+    if isinstance(last, int):
+        runs = df.drop_duplicates('run')['run'].iloc[-last:]
+        df = df[df['run'].isin(runs)]
+    gp = df.groupby(['script', 'stage'])
+    report = pd.DataFrame(dict(
+        n_runs=gp['run'].nunique(), n_calls=gp['wall'].count(),
+        wall_total=gp['wall'].sum(), wall_mean=gp['wall'].mean(),
+        wall_min=gp['wall'].min(), wall_max=gp['wall'].max(),
+        cpu_mean=gp['cpu'].mean(), rss_delta_max=gp['rss_delta'].max(),
+        process_peak_rss=gp['process_peak_rss'].max()))
+    report = report.reset_index()[columns]
+    return report.sort_values('wall_total', ascending=False,
+                              ignore_index=True)
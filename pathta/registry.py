@@ -0,0 +1,203 @@
+"""Registry of the studies (name, path and creation date)."""
+import os
+import re
+import json
+import sqlite3
+import logging
+from threading import RLock
+from functools import lru_cache
+
+from pathta.lock import file_lock
+from pathta.rwio import load_json, save_json, tmp_name
+
+
+logger = logging.getLogger('pathta')
+
+BP_FILE = 'bpsettings.json'
+BP_SQLITE = 'bpsettings.sqlite'
+BACKENDS = ('json', 'sqlite')
+
+
+@lru_cache(maxsize=None)
+def registry_folder():
+    """Get the folder where the registry is stored."""
+    dir_path = os.path.dirname(os.path.realpath(__file__))
+    bp_path = re.findall('(.*?)pathta', dir_path)[0]
+    return os.path.join(bp_path, 'pathta')
+
+
+class JsonRegistry(object):
+    """Registry stored in the bpsettings.json file.
+
+    Reads are cached until the modification time of the file changes and
+    updates are performed under an exclusive file lock, then atomically
+    written (temporary file and rename) so that concurrent processes never
+    read a partially written file.
+
+    Parameters
+    ----------
+    path : string
+        Path to the JSON file.
+    """
+
+    def __init__(self, path):  # noqa
+        self.path = path
+        self._lock = RLock()
+        self._stat, self._studies = None, {}
+        if not os.path.isfile(path):
+            with file_lock(path):
+                if not os.path.isfile(path):
+                    logger.info('Brainpipe file added to the path %s' % path)
+                    self._write({})
+
+    def load(self):
+        """Get the dictionary of every study."""
+        stat = os.stat(self.path)
+        stat = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        with self._lock:
+            if stat != self._stat:
+                self._studies, self._stat = load_json(self.path), stat
+            return self._studies
+
+    def get(self, name):
+        """Get the entry of a study (None if it doesn't exist)."""
+        entry = self.load().get(name)
+        return None if entry is None else dict(entry)
+
+    def names(self):
+        """Get the names of the registered studies."""
+        return list(self.load().keys())
+
+    def add(self, name, entry):
+        """Register a study.
+
+        Returns
+        -------
+        added : bool
+            False if a study with the same name already exists.
+        """
+        with self._lock, file_lock(self.path):
+            studies = load_json(self.path)
+            if name in studies:
+                return False
+            studies[name] = entry
+            self._write(studies)
+        return True
+
+    def remove(self, name):
+        """Unregister a study."""
+        with self._lock, file_lock(self.path):
+            studies = load_json(self.path)
+            studies.pop(name, None)
+            self._write(studies)
+
+    def _write(self, studies):
+        """Atomically write the file."""
+        tmp = tmp_name(self.path)
+        save_json(tmp, studies)
+        os.replace(tmp, self.path)
+
+
+class SqliteRegistry(object):
+    """Registry stored in a SQLite database.
+
+    Each lookup only reads the entry of one study, which stays fast with
+    thousands of registered studies. SQLite handles the locking between
+    concurrent processes. If the database is created while a
+    bpsettings.json file exists, its studies are imported.
+
+    Parameters
+    ----------
+    path : string
+        Path to the SQLite database.
+    """
+
+    def __init__(self, path):  # noqa
+        self.path = path
+        self._lock = RLock()
+        self._conn = sqlite3.connect(path, timeout=60.,
+                                     check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS studies (name TEXT "
+                               "PRIMARY KEY, entry TEXT NOT NULL)")
+            is_empty = self._conn.execute("SELECT COUNT(*) FROM "
+                                          "studies").fetchone()[0] == 0
+        json_path = os.path.join(os.path.dirname(path), BP_FILE)
+        if is_empty and os.path.isfile(json_path):
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO studies (name, entry) VALUES "
+                    "(?, ?)", [(k, json.dumps(v)) for k, v in load_json(
+                        json_path).items()])
+            logger.info("Studies imported from %s" % json_path)
+
+    def load(self):
+        """Get the dictionary of every study."""
+        with self._lock:
+            rows = self._conn.execute("SELECT name, entry FROM studies")
+            return {k: json.loads(v) for k, v in rows}
+
+    def get(self, name):
+        """Get the entry of a study (None if it doesn't exist)."""
+        with self._lock:
+            row = self._conn.execute("SELECT entry FROM studies WHERE name=?",
+                                     (name,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def names(self):
+        """Get the names of the registered studies."""
+        with self._lock:
+            rows = self._conn.execute("SELECT name FROM studies")
+            return [k[0] for k in rows]
+
+    def add(self, name, entry):
+        """Register a study.
+
+        Returns
+        -------
+        added : bool
+            False if a study with the same name already exists.
+        """
+        with self._lock, self._conn:
+            cur = self._conn.execute("INSERT OR IGNORE INTO studies (name, "
+                                     "entry) VALUES (?, ?)",
+                                     (name, json.dumps(entry)))
+        return cur.rowcount == 1
+
+    def remove(self, name):
+        """Unregister a study."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM studies WHERE name=?", (name,))
+
+
+_REGISTRIES = {}
+
+
+def get_registry(backend=None):
+    """Get the registry of the studies.
+
+    Registries are created once per process and then reused.
+
+    Parameters
+    ----------
+    backend : {'json', 'sqlite'} | None
+        Registry backend. If None, the `PATHTA_REGISTRY` environment variable
+        is used and default to 'json' (bpsettings.json).
+
+    Returns
+    -------
+    registry : JsonRegistry | SqliteRegistry
+        The registry.
+    """
+    if backend is None:
+        backend = os.environ.get('PATHTA_REGISTRY', 'json')
+    if backend not in BACKENDS:
+        raise ValueError("backend should be in %s" % ', '.join(BACKENDS))
+    if backend not in _REGISTRIES:
+        if backend == 'json':
+            path = os.path.join(registry_folder(), BP_FILE)
+            _REGISTRIES[backend] = JsonRegistry(path)
+        else:
+            path = os.path.join(registry_folder(), BP_SQLITE)
+            _REGISTRIES[backend] = SqliteRegistry(path)
+    return _REGISTRIES[backend]
@@ -1,9 +1,26 @@
 """Load, save and update json files."""
 import os
 import io
+import re
 import json
+import hashlib
+import logging
+from uuid import uuid4
+from copy import deepcopy
+from threading import RLock
 from datetime import datetime
 
+from pathta.lock import file_lock
+from pathta.iostats import timed, input_file, output_file
+
+
+DUPLICATES = ('increment', 'overwrite', 'fail')
+
+_JSON_CACHE = {}
+_JSON_LOCK = RLock()
+
+logger = logging.getLogger('pathta')
+
 
 def save_json(filename, config):
     """Save configuration file as JSON.
@@ -29,19 +46,33 @@ def save_json(filename, config):
             f.write(to_unicode(str_))
 
 
-def load_json(filename):
+def load_json(filename, cached=False):
     """Load configuration file as JSON.
 
     Parameters
     ----------
     filename : string
         Name of the configuration file to load.
+    cached : bool | False
+        Keep the parsed file in memory until its modification time changes.
+        A copy of the cached dictionary is returned.
 
     Returns
     -------
     config : dict
         Dictionary of config.
     """
+    if cached:
+        filename = os.path.abspath(filename)
+        stat = os.stat(filename)
+        key = (stat.st_mtime_ns, stat.st_size)
+        with _JSON_LOCK:
+            entry = _JSON_CACHE.get(filename)
+        if (entry is None) or (entry[0] != key):
+            entry = (key, load_json(filename))
+            with _JSON_LOCK:
+                _JSON_CACHE[filename] = entry
+        return deepcopy(entry[1])
     with open(filename) as f:
         # Load the configuration file :
         config = json.load(f)
@@ -58,60 +89,329 @@ def update_json(filename, update, backup=None):
     update : dict
         Dict for update.
     backup : str | None
-        Backup folder if needed.
+        Backup folder if needed. Instead of a full copy of the file, the
+        modifications are appended as a JSON patch to the
+        `<file>.history.jsonl` file of this folder (see :func:`json_version`
+        to rebuild a past version).
     """
     assert isinstance(update, dict)
     assert os.path.isfile(filename)
-    config = load_json(filename)
-    _backup_json(filename, backup)
-    config.update(update)
-    save_json(filename, config)
+    # concurrent updates are serialized so that none of them is lost
+    with file_lock(filename):
+        config = load_json(filename)
+        new_config = dict(config)
+        new_config.update(update)
+        _backup_json(filename, config, new_config, backup)
+        tmp = tmp_name(filename)
+        save_json(tmp, new_config)
+        os.replace(tmp, filename)
+
+
+def _json_sha(config):
+    """Get the hash of a json dictionary."""
+    str_ = json.dumps(config, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(str_.encode('utf8')).hexdigest()
 
 
-def _backup_json(filename, backup=None):
+def _history_file(filename, backup):
+    """Get the path to the history file of a json file."""
+    file = os.path.splitext(os.path.split(filename)[1])[0]
+    return os.path.join(backup, file + '.history.jsonl')
+
+
+def _backup_json(filename, config, new_config, backup=None):
+    """Append the modifications of a json file to its history."""
     if isinstance(backup, str):
-        assert os.path.isfile(filename)
         assert os.path.exists(backup)
-        # Load json file :
-        config = load_json(filename)
-        config_backup = config.copy()
-        # Datetime :
-        now = datetime.now()
-        now_lst = [now.year, now.month, now.day, now.hour, now.minute,
-                   now.second]
-        now_lst = '_'.join([str(k) for k in now_lst])
-        file, ext = os.path.splitext(os.path.split(filename)[1])
-        file += now_lst + ext
-        save_json(os.path.join(backup, file), config_backup)
-
-
-def save_file(name, *arg, compress=False, **kwargs):
+        history = _history_file(filename, backup)
+        record = dict(date=datetime.now().isoformat(timespec='seconds'),
+                      patch=json_patch(config, new_config),
+                      sha=_json_sha(new_config))
+        # If the file has been modified outside of `update_json` since the
+        # last update, the patches can't be chained. The full previous
+        # version is stored instead
+        last = _read_last_line(history)
+        if (last is None) or (json.loads(last)['sha'] != _json_sha(config)):
+            record['base'] = config
+        with io.open(history, 'a', encoding='utf8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def _read_last_line(filename):
+    """Read the last line of a file, without reading the whole file."""
+    if not os.path.isfile(filename):
+        return None
+    with open(filename, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        end = pos = f.tell()
+        block = b''
+        while pos > 0:
+            step = min(4096, pos)
+            pos -= step
+            f.seek(pos)
+            block = f.read(step) + block
+            if block.rstrip(b'\n').count(b'\n'):
+                break
+        lines = block.rstrip(b'\n').split(b'\n')
+        return lines[-1].decode('utf8') if end else None
+
+
+def _escape(key):
+    """Escape a key of a JSON pointer (RFC 6901)."""
+    return '/' + str(key).replace('~', '~0').replace('/', '~1')
+
+
+def _unescape(path):
+    """Unescape a key of a JSON pointer (RFC 6901)."""
+    return path[1:].replace('~1', '/').replace('~0', '~')
+
+
+def json_patch(config, new_config):
+    """Get the JSON patch (RFC 6902) between two dictionaries.
+
+    Only top-level keys are compared.
+
+    Parameters
+    ----------
+    config : dict
+        Original dictionary.
+    new_config : dict
+        Modified dictionary.
+
+    Returns
+    -------
+    patch : list
+        List of operations ('add', 'replace' and 'remove').
+    """
+    patch = [dict(op='remove', path=_escape(k)) for k in config if k not in
+             new_config]
+    for k, v in new_config.items():
+        if k not in config:
+            patch.append(dict(op='add', path=_escape(k), value=v))
+        elif config[k] != v:
+            patch.append(dict(op='replace', path=_escape(k), value=v))
+    return patch
+
+
+def apply_json_patch(config, patch):
+    """Apply a JSON patch (see :func:`json_patch`) to a dictionary.
+
+    Parameters
+    ----------
+    config : dict
+        Dictionary to patch (modified inplace).
+    patch : list
+        List of operations.
+
+    Returns
+    -------
+    config : dict
+        The patched dictionary.
+    """
+    for op in patch:
+        key = _unescape(op['path'])
+        if op['op'] == 'remove':
+            config.pop(key, None)
+        else:
+            config[key] = deepcopy(op['value'])
+    return config
+
+
+def json_history(filename, backup):
+    """Get the history of the updates of a json file.
+
+    Parameters
+    ----------
+    filename : string
+        Full path to the json file.
+    backup : string
+        Backup folder containing the history.
+
+    Returns
+    -------
+    history : list
+        List of dictionaries with the version number and the date of each
+        update. The version 0 is the file before the first update.
+    """
+    history = _history_file(filename, backup)
+    if not os.path.isfile(history):
+        return []
+    with io.open(history, encoding='utf8') as f:
+        dates = [json.loads(k)['date'] for k in f if k.strip()]
+    return [dict(version=0, date=None)] + [dict(version=n + 1, date=k) for
+                                           n, k in enumerate(dates)]
+
+
+def json_version(filename, backup, version):
+    """Rebuild a past version of a json file from its history.
+
+    Parameters
+    ----------
+    filename : string
+        Full path to the json file.
+    backup : string
+        Backup folder containing the history.
+    version : int
+        Version to rebuild (see :func:`json_history`). 0 is the file before
+        the first update and -1 the last version.
+
+    Returns
+    -------
+    config : dict
+        The rebuilt dictionary.
+    """
+    history = _history_file(filename, backup)
+    assert os.path.isfile(history), "No history for %s" % filename
+    with io.open(history, encoding='utf8') as f:
+        records = [json.loads(k) for k in f if k.strip()]
+    n_versions = len(records) + 1
+    if version < 0:
+        version += n_versions
+    if not 0 <= version < n_versions:
+        raise ValueError("version should be in [0, %i]" % (n_versions - 1))
+    config = deepcopy(records[0]['base'])
+    for record in records[0:version]:
+        if 'base' in record:
+            config = deepcopy(record['base'])
+        apply_json_patch(config, record['patch'])
+    return config
+
+
+@timed('save', output_file)
+def save_file(name, *arg, compress=False, duplicate='increment', level=None,
+              chunks=None, **kwargs):
     """Save a file without carrying of extension.
 
+    The file is first written to a temporary file of the same folder which
+    is then renamed, so that a file is never partially written.
+
     Parameters
     ----------
     name : string
         Full path to the file (could be pickle, mat, npy, npz, txt, json,
-        xslx, csv).
+        xslx, csv, parquet, feather, h5, hdf5). For .h5 / .hdf5 files,
+        arrays are saved as datasets, strings (or lists of strings) as
+        attributes, dictionaries as groups (loaded back as nested
+        dictionaries) and arrays of strings as UTF-8 string datasets. .mat,
+        .json and HDF5 files are saved from keyword arguments only. .pickle
+        files pickle the keyword arguments, or a single object given as
+        argument.
+    compress : bool | {'zstd', 'lz4', 'zlib'}
+        Compress the file. For .npz files, only zlib compression is supported
+        (True is equivalent to 'zlib'). .npy and .pickle files can be
+        compressed with any codec, chunk by chunk on several threads (see
+        :mod:`pathta.codec`). Compressed files are automatically detected by
+        :func:`load_file`. .parquet and .feather files use their own
+        compression (True is equivalent to 'zstd'). .h5 / .hdf5 files support
+        the 'gzip' (True) and 'lzf' HDF5 filters and .mat files the zlib
+        compression of Matlab (True). Compression is ignored, with a
+        warning, for .json and .xlsx files.
+    level : int | None
+        Compression level of the codec.
+    chunks : bool | tuple | dict | None
+        Chunk shape of the datasets of .h5 / .hdf5 files. Use True for an
+        automatic shape, a tuple for the same shape for every dataset or a
+        dictionary {dataset: shape}. Compressed datasets are always chunked.
+    duplicate : {'increment', 'overwrite', 'fail'}
+        Behavior if the file already exists. Use 'increment' to add a '(k)'
+        suffix to the name, 'overwrite' to replace the existing file or
+        'fail' to raise a FileExistsError.
+
+    Returns
+    -------
+    name : string
+        Full path to the saved file (incremented if the file already exists).
     """
-    name = safety_save(name)
+    if duplicate not in DUPLICATES:
+        raise ValueError("duplicate should be in %s" % ', '.join(DUPLICATES))
+    tmp = tmp_name(name)
+    try:
+        _write_file(tmp, *arg, compress=compress, level=level, chunks=chunks,
+                    **kwargs)
+        with open(tmp, 'rb+') as f:
+            os.fsync(f.fileno())
+        name = _publish(tmp, name, duplicate)
+    finally:
+        if os.path.isfile(tmp):
+            os.remove(tmp)
+    return name
+
+
+def _publish(tmp, name, duplicate):
+    """Give its final name to a written temporary file.
+
+    Unless overwriting, the file is hard linked to the first free name
+    (linking fails if the name exists, even when it has just been taken by
+    a concurrent process), so that no placeholder is ever created. The
+    temporary file is removed by the caller.
+    """
+    if duplicate == 'overwrite':
+        os.replace(tmp, name)
+        return name
+    while True:
+        try:
+            os.link(tmp, name)
+            return name
+        except FileExistsError:
+            if duplicate == 'fail':
+                raise FileExistsError("%s already exists" % name)
+            name = _increment_name(name)
+        except OSError:  # hard links not supported by the file system
+            name = safety_save(name, duplicate=duplicate)
+            os.replace(tmp, name)
+            return name
+
+
+def _write_file(name, *arg, compress=False, level=None, chunks=None,
+                **kwargs):
+    """Write a file according to its extension."""
     file_name, file_ext = os.path.splitext(name)
+    codec = 'zlib' if compress is True else compress
+    if codec and (file_ext in ['.json', '.xlsx']):
+        logger.warning("Compression not supported for %s files, the file "
+                       "is saved without compression" % file_ext)
+        codec = False
+    if arg and (file_ext in ['.mat', '.json', '.h5', '.hdf5']):
+        raise IOError("%s files are saved from keyword arguments only" % (
+            file_ext))
     if file_ext == '.pickle':  # Pickle
         import pickle
-        with open(name, 'wb') as f:
-            pickle.dump(kwargs, f)
+        if arg:
+            # a single object given as argument is pickled as is
+            assert (len(arg) == 1) and not kwargs, (
+                "Pickle either one argument or keyword arguments")
+            obj = arg[0]
+        else:
+            obj = kwargs
+        if codec:
+            _write_compressed(name, pickle.dumps(
+                obj, protocol=pickle.HIGHEST_PROTOCOL), codec, level)
+        else:
+            with open(name, 'wb') as f:
+                pickle.dump(obj, f)
     elif file_ext == '.mat':  # Matlab
         from scipy.io import savemat
-        savemat(name, kwargs)
+        if codec not in [None, False, True, 'zlib']:
+            raise IOError("Only zlib compression is supported for .mat files"
+                          ", use .npy or .pickle files for %s" % codec)
+        savemat(name, kwargs, do_compression=bool(codec))
     elif file_ext == '.npy':  # Numpy (single array)
         import numpy as np
-        np.save(name, *arg)
-    elif file_ext == '.npz':  # Numpy (multi array)
+        if codec:
+            buf = io.BytesIO()
+            np.save(buf, *arg)
+            _write_compressed(name, buf.getbuffer(), codec, level)
+        else:
+            np.save(name, *arg)
+    elif file_ext == '.npz':  # Numpy (multi array, one member per array)
         import numpy as np
-        if compress:
-            np.savez_compressed(name, kwargs)
+        if codec == 'zlib':
+            np.savez_compressed(name, *arg, **kwargs)
+        elif codec:
+            raise IOError("Only zlib compression is supported for .npz files"
+                          ", use .npy or .pickle files for %s" % codec)
         else:
-            np.savez(name, kwargs)
+            np.savez(name, *arg, **kwargs)
     elif file_ext == '.json':  # JSON
         save_json(name, kwargs)
     elif file_ext == '.xlsx':  # JSON
@@ -120,65 +420,333 @@ def save_file(name, *arg, compress=False, **kwargs):
         writer = pd.ExcelWriter(name)
         arg[0].to_excel(writer)
         writer.save()
+    elif file_ext in ['.parquet', '.feather']:  # Columnar DataFrame
+        import pandas as pd
+        assert isinstance(arg[0], pd.DataFrame)
+        # parquet and feather handle compression (default to zstd)
+        codec = 'zstd' if codec in [True, 'zlib'] else codec
+        if file_ext == '.parquet':
+            arg[0].to_parquet(name, compression=codec or None)
+        else:
+            # feather files have no index : only a default one is dropped,
+            # others are stored as columns
+            df = arg[0]
+            default = isinstance(df.index, pd.RangeIndex) and (
+                df.index.name is None) and (df.index.start == 0) and (
+                df.index.step == 1)
+            df.reset_index(drop=default).to_feather(
+                name, compression=codec or 'uncompressed')
+    elif file_ext in ['.h5', '.hdf5']:  # HDF5
+        import h5py
+        codec = 'gzip' if codec in [True, 'zlib'] else codec
+        if codec not in [None, False, 'gzip', 'lzf']:
+            raise IOError("Only gzip and lzf compression are supported for "
+                          "HDF5 files")
+        with h5py.File(name, 'w') as f:
+            _write_h5(f, kwargs, chunks=chunks, compression=codec or None,
+                      level=level)
     else:
         raise IOError("Extension %s not supported." % file_ext)
 
 
-def load_file(name):
+def _write_h5(group, data, chunks=None, compression=None, level=None,
+              prefix=''):
+    """Write a dictionary into an HDF5 group."""
+    import numpy as np
+    for key, value in data.items():
+        full_key = prefix + key
+        if isinstance(value, dict):
+            _write_h5(group.create_group(key), value, chunks=chunks,
+                      compression=compression, level=level,
+                      prefix=full_key + '/')
+            continue
+        if isinstance(value, str) or (isinstance(value, (list, tuple)) and (
+                len(value)) and all([isinstance(k, str) for k in value])):
+            group.attrs[key] = hdf5_write_str(value)
+            continue
+        value = np.asarray(value)
+        dtype = None
+        if value.dtype.kind == 'U':  # arrays of strings (e.g channel names)
+            import h5py
+            dtype = h5py.string_dtype()
+            value = value.astype(object)
+        if value.ndim == 0:  # scalars can't be chunked
+            group.create_dataset(key, data=value, dtype=dtype)
+            continue
+        d_chunks = chunks.get(full_key) if isinstance(chunks, dict) else chunks
+        if (d_chunks is None) and (compression is not None):
+            d_chunks = True
+        group.create_dataset(key, data=value, dtype=dtype, chunks=d_chunks,
+                             compression=compression,
+                             compression_opts=level if compression == 'gzip'
+                             else None)
+
+
+def _write_compressed(name, data, codec, level=None):
+    """Compress bytes and write them to a file."""
+    from pathta.codec import compress
+    with open(name, 'wb') as f:
+        f.write(compress(data, codec=codec, level=level))
+
+
+def _read_compressed(name):
+    """Read a file compressed with :func:`_write_compressed`."""
+    from pathta.codec import decompress
+    with open(name, 'rb') as f:
+        return decompress(f.read())
+
+
+def tmp_name(name):
+    """Get a temporary file name, in the same folder and with the same
+    extension as the file to write.
+
+    The name contains 'lock.' so that files being written are ignored by
+    `Study.search` (see :func:`is_temporary`).
+    """
+    path, file = os.path.split(name)
+    file_name, file_ext = os.path.splitext(file)
+    tmp = '.%s.lock.%s%s' % (file_name, uuid4().hex[0:8], file_ext)
+    return os.path.join(path, tmp)
+
+
+def is_temporary(name):
+    """Check if a file is being written (see :func:`tmp_name`) or is a lock
+    file."""
+    name = os.path.basename(name)
+    return ('lock.' in name) or name.endswith('.lock')
+
+
+@timed('load', input_file)
+def load_file(name, lazy=False, mmap_mode=None, variables=None, columns=None,
+              filters=None, chunksize=None, slices=None, chunk_cache=None):
     """Load a file without carrying of extension.
 
     Parameters
     ----------
     name : string
         Full path to the file (could be pickle, mat, npy, npz, txt, json, xlsx,
-        xls, csv).
+        xls, csv, h5, hdf5, parquet, feather).
+    lazy : bool | False
+        Avoid loading the data in memory. .npy arrays are memory-mapped
+        (read-only, unless `mmap_mode` is specified) and `variables` and
+        `slices` are ignored for .npz and .h5 / .hdf5 files. Note that,
+        unless `variables` or `slices` are given, .npz and .h5 / .hdf5 files
+        are always lazily loaded :
+
+            * .npz files are returned as a NpzFile where each array is only
+              loaded when accessed. The file should be closed after use
+              (e.g `with load_file(name) as f:`)
+            * .h5 / .hdf5 files are returned as a read-only h5py.File giving
+              sliceable datasets. The file should be closed after use (with
+              `close` or at the end of a `with` block)
+    mmap_mode : {None, 'r', 'r+', 'c'}
+        Memory-map .npy arrays (see np.load).
+    variables : list | None
+        Only load a subset of variables of .mat, .npz and .h5 / .hdf5 files.
+        For .npz and .h5 / .hdf5 files, the selected variables are read in
+        a dictionary.
+    columns : list | None
+        Only load a subset of columns of .parquet, .feather and .csv files.
+    filters : list | None
+        Row filters of .parquet and .feather files, applied while reading
+        (e.g [('subject', '==', 1)] or [[...], [...]] for a union of
+        conjunctions, see `pandas.read_parquet`).
+    chunksize : int | None
+        For .txt and .csv files, return an iterator over blocks of
+        `chunksize` lines instead of loading the whole file.
+    slices : tuple | dict | None
+        For .h5 / .hdf5 files, only read a part of the datasets. Use a tuple
+        of slices applied to every dataset (e.g
+        (slice(None), slice(1000, 2000)) for a time window) or a dictionary
+        {dataset path: slices}. Only the chunks touched by the selection are
+        read, in nested dictionaries (one per group).
+    chunk_cache : int | None
+        Size (in bytes) of the HDF5 chunk cache of each dataset (h5py default
+        is 1MB). Increase it when reading several selections from the same
+        chunks.
     """
     assert os.path.isfile(name)
     file_name, file_ext = os.path.splitext(name)
+    if isinstance(variables, str):
+        variables = [variables]
     if file_ext == '.pickle':  # Pickle :
         import pickle
-        return pd.read_pickle(name)
-        # with open(name, "rb") as f:
-        #     arch = pickle.load(f)
-        # return arch
+        from pathta.codec import is_compressed
+        if is_compressed(name):
+            return pickle.loads(_read_compressed(name))
+        with open(name, "rb") as f:
+            arch = pickle.load(f)
+        return arch
     elif file_ext == '.mat':  # Matlab :
         from scipy.io import loadmat
-        return loadmat(name)
-    elif file_ext in ['.npy', '.npz']:  # Numpy (single / multi array)
+        return loadmat(name, variable_names=variables)
+    elif file_ext == '.npy':  # Numpy (single array)
         import numpy as np
-        return np.load(name)
-    elif file_ext == '.txt':  # text file
+        from pathta.codec import is_compressed
+        if is_compressed(name):
+            if lazy or mmap_mode:
+                logger.warning("%s is compressed and can't be memory-mapped"
+                               % name)
+            return np.load(io.BytesIO(_read_compressed(name)))
+        if lazy and (mmap_mode is None):
+            mmap_mode = 'r'
+        return np.load(name, mmap_mode=mmap_mode)
+    elif file_ext == '.npz':  # Numpy (multi array)
         import numpy as np
-        return np.genfromtxt(name)
+        arch = np.load(name)
+        if _is_legacy_npz(arch):
+            # files saved by older versions store the dict of arrays as a
+            # single pickled object
+            arch.close()
+            with np.load(name, allow_pickle=True) as legacy:
+                return legacy['arr_0'].item()
+        if lazy or (variables is None):
+            return arch
+        with arch:
+            return {k: arch[k] for k in variables}
+    elif file_ext == '.txt':  # text file
+        from pathta.text import load_array
+        return load_array(name, columns=columns, chunksize=chunksize)
     elif file_ext == '.json':  # JSON
         return load_json(name)
     elif file_ext in ['.xls', '.xlsx']:  # Excel
         import pandas as pd
         return pd.read_excel(name)
-    elif file_ext in ['.xls', '.xlsx']:  # CSV
+    elif file_ext == '.csv':  # CSV
+        from pathta.text import load_text
+        return load_text(name, columns=columns, chunksize=chunksize)
+    elif file_ext == '.parquet':  # Parquet
+        import pandas as pd
+        return pd.read_parquet(name, columns=columns, filters=filters)
+    elif file_ext == '.feather':  # Feather
         import pandas as pd
-        return pd.read_csv(name)
+        if filters is None:
+            return pd.read_feather(name, columns=columns)
+        import pyarrow.dataset as ds
+        from pyarrow.parquet import filters_to_expression
+        table = ds.dataset(name, format='feather').to_table(
+            columns=columns, filter=filters_to_expression(filters))
+        return table.to_pandas()
     elif file_ext in ['.hdf5', '.h5']:  # HDF5
         import h5py
-        return h5py.File(name, 'r')
+        kw = dict() if chunk_cache is None else dict(rdcc_nbytes=chunk_cache)
+        arch = h5py.File(name, 'r', **kw)
+        if lazy or ((variables is None) and (slices is None)):
+            return arch
+        with arch:
+            return _read_h5(arch, variables, slices)
     else:
         raise IOError("Extension %s not supported." % file_ext)
 
 
-def safety_save(name):
+def _is_legacy_npz(arch):
+    """Check if a .npz file only contains a pickled dictionary."""
+    from numpy.lib import format as fmt
+    if arch.files != ['arr_0']:
+        return False
+    with arch.zip.open('arr_0.npy') as f:
+        version = fmt.read_magic(f)
+        if version == (1, 0):
+            shape, _, dtype = fmt.read_array_header_1_0(f)
+        else:
+            shape, _, dtype = fmt.read_array_header_2_0(f)
+    # the dictionary is stored as a 0-d object array
+    return dtype.hasobject and (shape == ())
+
+
+def _read_h5(arch, variables=None, slices=None):
+    """Read the datasets (or a selection of them) of an HDF5 file.
+
+    The whole file is read as nested dictionaries (one per group, with its
+    attributes), a selection of datasets as a flat {path: array}
+    dictionary.
+    """
+    import h5py
+    if variables is None:
+        out = {k: hdf5_read_str(v) for k, v in arch.attrs.items()}
+        for k, v in arch.items():
+            out[k] = _read_h5(v, slices=slices) if isinstance(
+                v, h5py.Group) else _read_dataset(v, slices)
+        return out
+    return {k: _read_dataset(arch[k], slices) for k in variables}
+
+
+def _read_dataset(dset, slices=None):
+    """Read a dataset (or a selection of it), decoding strings."""
+    import h5py
+    import numpy as np
+    key = dset.name.lstrip('/')
+    sel = slices.get(key, ()) if isinstance(slices, dict) else slices
+    info = h5py.check_string_dtype(dset.dtype)
+    is_str = (info is not None) and (info.length is None)  # variable length
+    if is_str:
+        dset = dset.asstr()
+    value = dset[()] if (sel in [None, ()]) or (dset.ndim == 0) else (
+        dset[sel])
+    if is_str and isinstance(value, np.ndarray):
+        value = value.astype(str)
+    return value
+
+
+def safety_save(name, duplicate='increment', reserve=False):
     """Check if a file name exist.
 
-    If it exist, increment it with '(x)'.
+    If it exist, increment it with '(x)'. The increment is found with a
+    single scan of the folder.
+
+    Parameters
+    ----------
+    name : string
+        Full path to the file.
+    duplicate : {'increment', 'overwrite', 'fail'}
+        Behavior if the file already exists. Use 'increment' to add a '(k)'
+        suffix to the name, 'overwrite' to keep the name or 'fail' to raise
+        a FileExistsError.
+    reserve : bool | False
+        Atomically create an empty file with the returned name (exclusive
+        creation), so that concurrent processes can't pick the same name.
+
+    Returns
+    -------
+    name : string
+        The free file name.
     """
-    k = 1
-    while os.path.isfile(name):
-        fname, fext = os.path.splitext(name)
-        if fname.find('(') + 1:
-            name = fname[0:fname.find('(') + 1] + str(k) + ')' + fext
-        else:
-            name = fname + '(' + str(k) + ')' + fext
-        k += 1
-    return name
+    if duplicate not in DUPLICATES:
+        raise ValueError("duplicate should be in %s" % ', '.join(DUPLICATES))
+    if duplicate == 'overwrite':
+        return name
+    if not reserve:
+        if os.path.isfile(name):
+            if duplicate == 'fail':
+                raise FileExistsError("%s already exists" % name)
+            name = _increment_name(name)
+        return name
+    while True:
+        # exclusive creation directly probes the name (no extra stat)
+        try:
+            os.close(os.open(name, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return name
+        except FileExistsError:
+            # the name exists (or has been taken by a concurrent process)
+            if duplicate == 'fail':
+                raise FileExistsError("%s already exists" % name)
+            name = _increment_name(name)
+
+
+def _increment_name(name):
+    """Get the next free 'file(k).ext' name, with a single folder scan."""
+    path, file = os.path.split(name)
+    fname, fext = os.path.splitext(file)
+    if fname.find('(') + 1:
+        fname = fname[0:fname.find('(')]
+    regexp = re.compile(r'%s\((\d+)\)%s$' % (re.escape(fname),
+                                              re.escape(fext)))
+    k = 0
+    for file in os.listdir(path or '.'):
+        match = regexp.match(file)
+        if match:
+            k = max(k, int(match.group(1)))
+    return os.path.join(path, '%s(%i)%s' % (fname, k + 1, fext))
 
 
 def hdf5_write_str(lst):
@@ -211,9 +779,11 @@ def hdf5_read_str(lst):
     Returns
     -------
     lst : array_like
-        ConveDecodedrted list of strings
+        Decoded list of strings
     """
+    import numpy as np
     if isinstance(lst, (list, tuple, np.ndarray)):
-        return [k.decode('utf-8') for k in lst]
-    else:
+        return [hdf5_read_str(k) for k in lst]
+    elif isinstance(lst, bytes):
         return lst.decode('utf-8')
+    return lst
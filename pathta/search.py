@@ -0,0 +1,86 @@
+"""Match file names against multiple search patterns at once."""
+import re
+from fnmatch import translate
+
+
+MODES = ('str', 'regex', 'glob')
+
+
+class FileMatcher(object):
+    """Compile several search patterns into a single regular expression.
+
+    Instead of testing each (file, pattern) pair in Python, all of the
+    patterns are merged into one compiled expression, tested once per file
+    name. For a union, the expression is an alternation of the patterns.
+    For an intersection, it is a sequence of lookaheads (one per pattern),
+    so that the regex engine scans the name once per pattern.
+
+    Parameters
+    ----------
+    patterns : list
+        List of string patterns.
+    mode : {'str', 'regex', 'glob'}
+        Pattern type. Use 'str' for plain sub-strings, 'regex' for regular
+        expressions searched anywhere in the name or 'glob' for shell-style
+        wildcards matched against the full name (e.g '*_pow.npz').
+    intersection : bool | True
+        Specify if the intersection should be considered across search
+        patterns or the union.
+    case : bool | True
+        Define if the search method have to take care of the case.
+    """
+
+    def __init__(self, patterns, mode='str', intersection=True, case=True):  # noqa
+        if mode not in MODES:
+            raise ValueError("mode should be in %s" % ', '.join(MODES))
+        self.patterns = list(patterns)
+        self.mode = mode
+        self.intersection = intersection
+        self.case = case
+        self._regex = self._compile()
+
+    def _compile(self):
+        """Build the regular expression of all patterns."""
+        if not len(self.patterns):
+            return None
+        flags = re.DOTALL if self.case else re.DOTALL | re.IGNORECASE
+        if self.mode == 'str':
+            frags = [re.escape(k) for k in self.patterns]
+        elif self.mode == 'regex':
+            frags = list(self.patterns)
+        else:
+            frags = [translate(k) for k in self.patterns]
+        # glob patterns are anchored on the full name, the others can be
+        # found anywhere in the name
+        anchored = self.mode == 'glob'
+        if self.intersection and len(frags) > 1:
+            prefix = '' if anchored else '.*'
+            regex = ''.join(['(?=%s(?:%s))' % (prefix, k) for k in frags])
+            return re.compile(regex, flags).match
+        regex = '|'.join(['(?:%s)' % k for k in frags])
+        regex = re.compile(regex, flags)
+        return regex.match if anchored else regex.search
+
+    def __call__(self, name):
+        """Test if a file name match the patterns."""
+        if self._regex is None:
+            return True
+        return self._regex(name) is not None
+
+    def filter(self, names):
+        """Get the list of names matching the patterns.
+
+        Parameters
+        ----------
+        names : iterable
+            Iterable of file names.
+
+        Returns
+        -------
+        names : list
+            List of matching names, in the input order.
+        """
+        if self._regex is None:
+            return list(names)
+        fcn = self._regex
+        return [k for k in names if fcn(k) is not None]
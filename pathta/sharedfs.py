@@ -0,0 +1,178 @@
+"""Reduce the metadata operations on shared file systems (NFS, Lustre).
+
+Folder listings are stored in a snapshot shared by every process of a node
+(in /dev/shm, or in the temporary folder) and reused within a time to live.
+Folders are created with a single metadata call and, in shared file
+system mode, remembered by the process.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+from threading import Lock
+
+from pathta.lock import file_lock
+
+
+logger = logging.getLogger('pathta')
+
+DEFAULT_TTL = 30.
+_KNOWN_FOLDERS = set()
+_KNOWN_LOCK = Lock()
+
+
+def makedirs(path, remember=False):
+    """Create a folder (and its parents) if it doesn't exist.
+
+    When the folder already exists, a single `mkdir` call (followed by a
+    `stat` checking that the path is a folder) is needed.
+
+    Parameters
+    ----------
+    path : string
+        Path to the folder.
+    remember : bool | False
+        Remember the folders created (or found) by the process, so that
+        asking again for the same folder doesn't touch the file system. A
+        remembered folder removed by another mean than
+        :meth:`pathta.Study.delete` should be forgotten with
+        :func:`forget_folder`.
+    """
+    if remember and (path in _KNOWN_FOLDERS):
+        return path
+    try:
+        os.mkdir(path)
+    except FileExistsError:
+        if not os.path.isdir(path):
+            raise
+    except FileNotFoundError:  # missing parents
+        os.makedirs(path, exist_ok=True)
+    if remember:
+        with _KNOWN_LOCK:
+            _KNOWN_FOLDERS.add(path)
+    return path
+
+
+def forget_folder(path):
+    """Forget a folder and its sub-folders (e.g after removing them)."""
+    prefix = os.path.join(path, '')
+    with _KNOWN_LOCK:
+        for k in [k for k in _KNOWN_FOLDERS if (k == path) or (
+                k.startswith(prefix))]:
+            _KNOWN_FOLDERS.discard(k)
+
+
+def node_folder():
+    """Get a folder shared by the processes of the node (not of the FS)."""
+    root = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    uid = os.getuid() if hasattr(os, 'getuid') else 0
+    return makedirs(os.path.join(root, 'pathta-%i' % uid))
+
+
+class ListingSnapshot(object):
+    """Folder listings shared by the processes of a node.
+
+    The first process listing a folder stores the names of its files in a
+    snapshot of the node folder. Other processes of the node reuse it as
+    long as it is younger than `ttl`, so that a folder of the shared file
+    system is listed at most once per `ttl` and per node. A lock makes the
+    processes of the node wait for the listing in progress instead of
+    listing the folder again.
+
+    Files created by other nodes are only seen once the snapshot expired.
+    Use :meth:`invalidate` after writing in a folder. Expired snapshots are
+    removed when writing a new one (at most once per `ttl`).
+
+    Parameters
+    ----------
+    ttl : float | 30.
+        Time to live of the snapshots (in seconds).
+    path : string | None
+        Folder of the snapshots. By default, a pathta-<uid> folder in
+        /dev/shm (or in the temporary folder).
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, path=None):  # noqa
+        self.ttl = ttl
+        self.path = makedirs(path) if isinstance(path, str) else (
+            node_folder())
+        self._last_clean = 0.
+
+    def _snapshot_file(self, folder):
+        key = hashlib.sha1(os.path.abspath(folder).encode()).hexdigest()
+        return os.path.join(self.path, key[0:20] + '.json')
+
+    def _read(self, file):
+        """Read a snapshot (None if it is missing or too old)."""
+        try:
+            with open(file, 'r') as f:
+                snap = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if time.time() - snap['time'] > self.ttl:
+            return None
+        return snap['files']
+
+    def listdir(self, folder):
+        """List the files of a folder.
+
+        Parameters
+        ----------
+        folder : string
+            Path to the folder.
+
+        Returns
+        -------
+        files : list
+            Names of the files of the folder.
+        """
+        file = self._snapshot_file(folder)
+        files = self._read(file)
+        if files is not None:
+            return files
+        with file_lock(file):
+            # the folder may have been listed while waiting for the lock
+            files = self._read(file)
+            if files is not None:
+                return files
+            files = os.listdir(folder)
+            tmp = '%s.%i.tmp' % (file, os.getpid())
+            with open(tmp, 'w') as f:
+                json.dump(dict(time=time.time(), folder=folder, files=files),
+                          f)
+            os.replace(tmp, file)
+        logger.debug("    Snapshot of %s updated" % folder)
+        self._remove_expired()
+        return files
+
+    def _remove_expired(self):
+        """Remove the expired snapshots of the node folder.
+
+        Lock files are kept, since other processes may be waiting on them.
+        """
+        now = time.time()
+        if now - self._last_clean < self.ttl:
+            return
+        self._last_clean = now
+        n_removed = 0
+        with os.scandir(self.path) as it:
+            for entry in it:
+                if not entry.name.endswith(('.json', '.tmp')):
+                    continue
+                try:
+                    if now - entry.stat().st_mtime > self.ttl:
+                        os.remove(entry.path)
+                        n_removed += 1
+                except FileNotFoundError:  # removed by another process
+                    pass
+        if n_removed:
+            logger.debug("    %i expired snapshots removed" % n_removed)
+
+    def invalidate(self, folder):
+        """Remove the snapshot of a folder."""
+        try:
+            os.remove(self._snapshot_file(folder))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,307 @@
+"""Chunked N-dimensional arrays stored on disk, one file per chunk."""
+import os
+import json
+import logging
+from itertools import product
+
+from pathta.rwio import tmp_name, is_temporary
+from pathta.parallel import bounded_map
+
+
+logger = logging.getLogger('pathta')
+
+META_FILE = 'array.json'
+CHUNK_BYTES = 4 * 1024 * 1024  # default (maximum) size of a chunk
+
+
+def _guess_chunks(shape, dtype):
+    """Get a chunk shape of at most CHUNK_BYTES, halving the largest axis."""
+    chunks = [max(k, 1) for k in shape]
+    while (len(chunks) and (max(chunks) > 1) and (
+            dtype.itemsize * _prod(chunks) > CHUNK_BYTES)):
+        k = chunks.index(max(chunks))
+        chunks[k] = (chunks[k] + 1) // 2
+    return tuple(chunks)
+
+
+def _prod(shape):
+    out = 1
+    for k in shape:
+        out *= k
+    return out
+
+
+def _normalize_key(key, shape):
+    """Convert an index into a list of (start, stop, step, is_int)."""
+    if not isinstance(key, tuple):
+        key = (key,)
+    if Ellipsis in key:
+        k = key.index(Ellipsis)
+        n_fill = len(shape) - len(key) + 1
+        key = key[0:k] + (slice(None),) * n_fill + key[k + 1:]
+    if len(key) > len(shape):
+        raise IndexError("Too many indices for an array of dimension %i" % (
+            len(shape)))
+    key = key + (slice(None),) * (len(shape) - len(key))
+    out = []
+    for k, n in zip(key, shape):
+        if isinstance(k, slice):
+            start, stop, step = k.indices(n)
+            if step < 1:
+                raise IndexError("Only positive steps are supported")
+            stop = max(start, stop)
+            out.append((start, stop, step, False))
+        else:
+            k = int(k)
+            k = k + n if k < 0 else k
+            if not 0 <= k < n:
+                raise IndexError("Index %i out of bounds for axis of size "
+                                 "%i" % (k, n))
+            out.append((k, k + 1, 1, True))
+    return out
+
+
+class ArrayStore(object):
+    """N-dimensional array split into chunks stored in separate files.
+
+    The array is stored in a folder containing its description (array.json)
+    and one file per chunk. Each chunk is written to a temporary file which
+    is then renamed, so that several processes can write different chunks
+    in parallel without any lock and readers never see partially written
+    chunks. Reading a slice only reads the chunks it touches. Chunks which
+    have never been written are filled with `fill_value`.
+
+    Writing a selection which only covers a part of a chunk reads, updates
+    and rewrites the chunk : processes writing in parallel should write
+    disjoint sets of chunks.
+
+    Parameters
+    ----------
+    path : string
+        Folder of the array.
+    shape : tuple | None
+        Shape of the array. If None, the array should already exist.
+    chunks : tuple | None
+        Shape of the chunks. By default, chunks of at most 4MB are used.
+    dtype : string | 'float64'
+        Data type of the array.
+    fill_value : scalar | 0
+        Value of the chunks that have not been written.
+    compress : bool | {'zstd', 'lz4', 'zlib'}
+        Compress each chunk (see :mod:`pathta.codec`). True means zlib.
+    n_jobs : int | None
+        Number of threads reading and writing chunks. By default, all of
+        the CPUs are used.
+    """
+
+    def __init__(self, path, shape=None, chunks=None, dtype='float64',
+                 fill_value=0, compress=False, n_jobs=None):  # noqa
+        import numpy as np
+        self.path = path
+        self.n_jobs = n_jobs
+        meta_file = os.path.join(path, META_FILE)
+        if shape is not None:
+            dtype = np.dtype(dtype)
+            if dtype.hasobject:
+                raise ValueError("Object arrays can't be stored in chunks")
+            shape = tuple([int(k) for k in shape])
+            assert len(shape) >= 1, "The array should have at least one axis"
+            chunks = _guess_chunks(shape, dtype) if chunks is None else (
+                tuple([int(k) for k in chunks]))
+            assert len(chunks) == len(shape), "chunks should have %i axes" % (
+                len(shape))
+            assert all([k >= 1 for k in chunks]), "chunks should be positive"
+            codec = 'zlib' if compress is True else (compress or None)
+            if hasattr(fill_value, 'item'):  # numpy scalar
+                fill_value = fill_value.item()
+            meta = dict(shape=list(shape), chunks=list(chunks),
+                        dtype=dtype.str, fill_value=fill_value, codec=codec)
+            if not os.path.isfile(meta_file):
+                os.makedirs(path, exist_ok=True)
+                tmp = tmp_name(meta_file)
+                with open(tmp, 'w') as f:
+                    json.dump(meta, f)
+                try:
+                    # link fails if a concurrent process created the array
+                    os.link(tmp, meta_file)
+                    logger.info("    Array store %s created" % path)
+                except FileExistsError:
+                    pass
+                except OSError:  # hard links not supported by the FS
+                    if not os.path.isfile(meta_file):
+                        os.replace(tmp, meta_file)
+                        logger.info("    Array store %s created" % path)
+                finally:
+                    if os.path.isfile(tmp):
+                        os.remove(tmp)
+        elif not os.path.isfile(meta_file):
+            raise FileNotFoundError("No array store in %s (shape should be "
+                                    "given to create it)" % path)
+        with open(meta_file, 'r') as f:
+            stored = json.load(f)
+        if (shape is not None) and (json.dumps(stored, sort_keys=True) != (
+                json.dumps(meta, sort_keys=True))):
+            raise ValueError("An array with a different description already "
+                             "exists in %s : %s" % (path, str(stored)))
+        self.shape = tuple(stored['shape'])
+        self.chunks = tuple(stored['chunks'])
+        self.dtype = np.dtype(stored['dtype'])
+        self.fill_value = stored['fill_value']
+        self.codec = stored['codec']
+
+    @property
+    def ndim(self):
+        """Number of dimensions."""
+        return len(self.shape)
+
+    @property
+    def nchunks(self):
+        """Number of chunks along each axis."""
+        return tuple([-(-n // c) for n, c in zip(self.shape, self.chunks)])
+
+    def __len__(self):  # noqa
+        return self.shape[0]
+
+    def __repr__(self):  # noqa
+        return "ArrayStore(%s, shape=%s, chunks=%s, dtype=%s)" % (
+            self.path, str(self.shape), str(self.chunks), str(self.dtype))
+
+    def _chunk_file(self, idx):
+        return os.path.join(self.path, '.'.join(map(str, idx)) + '.chunk')
+
+    def _chunk_shape(self, idx):
+        return tuple([min(c, n - i * c) for i, c, n in zip(
+            idx, self.chunks, self.shape)])
+
+    def _touched(self, box):
+        """Indices of the chunks intersecting a box [(start, stop), ...]."""
+        ranges = [range(start // c, -(-stop // c)) for (start, stop), c in zip(
+            box, self.chunks)]
+        return list(product(*ranges))
+
+    def _intersect(self, idx, box):
+        """Get the slices of the intersection in the chunk and in the box."""
+        in_chunk, in_box = [], []
+        for i, c, (start, stop) in zip(idx, self.chunks, box):
+            lo, hi = max(start, i * c), min(stop, (i + 1) * c)
+            in_chunk.append(slice(lo - i * c, hi - i * c))
+            in_box.append(slice(lo - start, hi - start))
+        return tuple(in_chunk), tuple(in_box)
+
+    def read_chunk(self, idx):
+        """Read a chunk (filled with `fill_value` if it doesn't exist).
+
+        Parameters
+        ----------
+        idx : tuple
+            Index of the chunk along each axis.
+
+        Returns
+        -------
+        chunk : array_like
+            The chunk.
+        """
+        import numpy as np
+        shape = self._chunk_shape(idx)
+        try:
+            with open(self._chunk_file(idx), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return np.full(shape, self.fill_value, dtype=self.dtype)
+        if self.codec is not None:
+            from pathta.codec import decompress
+            data = decompress(data, n_jobs=1)
+        return np.frombuffer(data, dtype=self.dtype).reshape(shape).copy()
+
+    def write_chunk(self, idx, chunk):
+        """Atomically write a full chunk.
+
+        Parameters
+        ----------
+        idx : tuple
+            Index of the chunk along each axis.
+        chunk : array_like
+            Data of the chunk.
+        """
+        import numpy as np
+        shape = self._chunk_shape(idx)
+        data = np.ascontiguousarray(np.broadcast_to(chunk, shape),
+                                    dtype=self.dtype).tobytes()
+        if self.codec is not None:
+            from pathta.codec import compress
+            data = compress(data, codec=self.codec, n_jobs=1)
+        file = self._chunk_file(idx)
+        tmp = tmp_name(file)
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, file)
+        except BaseException:
+            if os.path.isfile(tmp):
+                os.remove(tmp)
+            raise
+
+    def _map(self, fcn, items):
+        n_jobs = 1 if len(items) <= 1 else self.n_jobs
+        return list(bounded_map(fcn, items, n_jobs=n_jobs))
+
+    def __getitem__(self, key):  # noqa
+        import numpy as np
+        key = _normalize_key(key, self.shape)
+        box = [(start, stop) for start, stop, _, _ in key]
+        out = np.empty([stop - start for start, stop in box],
+                       dtype=self.dtype)
+
+        def _read(idx):
+            in_chunk, in_box = self._intersect(idx, box)
+            out[in_box] = self.read_chunk(idx)[in_chunk]
+
+        if out.size:
+            self._map(_read, self._touched(box))
+        sel = tuple([0 if is_int else slice(None, None, step) for
+                     _, _, step, is_int in key])
+        return out[sel]
+
+    def __setitem__(self, key, value):  # noqa
+        import numpy as np
+        key = _normalize_key(key, self.shape)
+        if any([step != 1 for _, _, step, _ in key]):
+            # strided selection : update the bounding box
+            box = tuple([slice(start, stop) for start, stop, _, _ in key])
+            data = self[box]
+            data[tuple([slice(None, None, step) if not is_int else 0 for
+                        _, _, step, is_int in key])] = value
+            self[box] = data
+            return
+        box = [(start, stop) for start, stop, _, _ in key]
+        shape = tuple([stop - start for start, stop in box])
+        value = np.asarray(value, dtype=self.dtype)
+        value = np.broadcast_to(value, tuple([
+            n for n, (_, _, _, is_int) in zip(shape, key) if not is_int]))
+        value = value.reshape(shape)
+
+        def _write(idx):
+            in_chunk, in_box = self._intersect(idx, box)
+            if self._chunk_shape(idx) == value[in_box].shape:
+                chunk = value[in_box]
+            else:
+                chunk = self.read_chunk(idx)
+                chunk[in_chunk] = value[in_box]
+            self.write_chunk(idx, chunk)
+
+        if value.size:
+            self._map(_write, self._touched(box))
+
+    def read(self):
+        """Read the whole array."""
+        return self[...]
+
+    def written_chunks(self):
+        """Get the indices of the chunks which have been written."""
+        out = []
+        with os.scandir(self.path) as it:
+            for entry in it:
+                if entry.name.endswith('.chunk') and not (
+                        is_temporary(entry.name)):
+                    out.append(tuple(map(int, entry.name[0:-6].split('.'))))
+        return sorted(out)
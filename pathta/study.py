@@ -1,22 +1,38 @@
 """Handle pathta studies (files and folders)."""
 import os
-import re
-import sys
+import asyncio
+import traceback
 import logging
+from functools import partial
+from weakref import WeakKeyDictionary
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
-from itertools import product
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from shutil import rmtree
 
 from pathta.syslog import set_log_level
-from pathta.rwio import (load_json, save_json, update_json, load_file,
-                         save_file, safety_save)
+from pathta.rwio import (load_json, update_json, load_file, save_file,
+                         safety_save, json_history, json_version,
+                         is_temporary)
+from pathta.search import FileMatcher
+from pathta.index import FileIndex
+from pathta.walk import scan_tree, iter_tree, iter_dir
+from pathta.cache import LoadCache, sizeof
+from pathta.parallel import bounded_map, get_n_jobs, BackgroundWriter
+from pathta.writer import open_writer
+from pathta.store import ArrayStore
+from pathta.memoize import DiskMemoize
+from pathta.profiler import Timer, profile_report, write_record
+from pathta.manifest import (build_manifest, load_manifest, save_manifest,
+                             sync)
+from pathta.sharedfs import (ListingSnapshot, DEFAULT_TTL, makedirs,
+                             forget_folder)
+from pathta import iostats
+from pathta.registry import get_registry, BP_FILE, registry_folder
 
 
-BP_FILE = 'bpsettings.json'
-
 logger = logging.getLogger('pathta')
 
 
@@ -28,6 +44,30 @@ class Study(object):
     name: string | None
         Name of the study. If this study already exists, this will load
         the path with the associated database.
+    index : bool | False
+        Use a persistent index of the files (stored in the cache/ folder of
+        the study) for searching files. Folders are only listed again when
+        their modification time changed.
+    cache : bool | int | None
+        Keep loaded files in memory. Use True for a budget of 256MB or an
+        integer to specify the budget (in bytes). Files are loaded again if
+        they are modified on disk. Cached arrays are read-only, other
+        data (dictionaries, DataFrames, etc.) is copied at each load.
+    registry : {'json', 'sqlite'} | None
+        Backend of the registry of studies. Use 'json' for the
+        bpsettings.json file or 'sqlite' for a SQLite database (faster with
+        many studies and many concurrent processes). By default, the
+        `PATHTA_REGISTRY` environment variable is used, otherwise 'json'.
+    shared_fs : bool | float | None
+        Shared file system mode (NFS, Lustre), reducing the load of the
+        metadata server when many processes use the study. Folder listings
+        are shared by the processes of a node and reused during a time to
+        live (True for 30s, or a number of seconds). Files written by other
+        nodes are then found once the listing expired. Folders created by
+        the study are also remembered by the process (folders removed
+        outside of :meth:`delete` should be forgotten with
+        `pathta.sharedfs.forget_folder`). By default, the
+        `PATHTA_SHARED_FS` environment variable (time to live) is used.
 
     Examples
     --------
@@ -47,24 +87,37 @@ class Study(object):
     >>> data = st.load('features', 'file2.pickle')
     """
 
-    def __init__(self, name, verbose=None):  # noqa
+    def __init__(self, name, verbose=None, index=False, cache=None,
+                 registry=None, shared_fs=None):  # noqa
         set_log_level(verbose)
         assert isinstance(name, str)
         self.name = name
-        # Get path to the bp file :
-        bp_path = self._path_bpsettings()
-        # If it doesn't exist, create it
-        if not os.path.isfile(bp_path):
-            logger.info('Brainpipe file added to the path %s' % bp_path)
-            save_json(bp_path, {})
+        self._use_index, self._index = index, None
+        if cache is True:
+            cache = LoadCache()
+        elif isinstance(cache, (int, float)) and not isinstance(cache, bool):
+            cache = LoadCache(max_bytes=cache)
+        self._cache = cache if isinstance(cache, LoadCache) else None
+        self._writer = None
+        if shared_fs is None:
+            shared_fs = float(os.environ.get('PATHTA_SHARED_FS', 0)) or None
+        if shared_fs is True:
+            shared_fs = DEFAULT_TTL
+        self._snapshot = ListingSnapshot(ttl=shared_fs) if (
+            shared_fs) else None
+        self._executor, self._own_executor = None, False
+        self._max_concurrency = get_n_jobs(None)
+        self._semaphores = WeakKeyDictionary()
+        # Get the registry of studies (created if it doesn't exist) :
+        self._registry = get_registry(registry)
         # Check if the study exist :
-        cfg = load_json(bp_path)
-        if self.name not in cfg.keys():
+        entry = self._registry.get(self.name)
+        if entry is None:
             logger.warning("Study %s doesn't exist. Use `add` to create "
                            "it." % self.name)
             return None
         # Load the study and get path to it :
-        self.config = cfg
+        self.config = {self.name: entry}
         self.path = self['path']
         self.created = self['created']
         logger.info('Study %s loaded' % self.name)
@@ -108,10 +161,8 @@ class Study(object):
             Path to the study.
         """
         assert os.path.isdir(path)
-        # Load the config :
-        bp_path = self._path_bpsettings()
-        self.config = load_json(bp_path)
-        if self.name in self.config.keys():
+        # Check if the study already exist :
+        if self._registry.get(self.name) is not None:
             logger.warning("%s already exist. Use a different name or "
                            "delete it before" % self.name)
             return None
@@ -128,18 +179,16 @@ class Study(object):
         now_str = [str(k) for k in (now.month, now.day, now.year, now.hour,
                                     now.minute, now.second)]
         # Fill the config file :
-        self.config.update({self.name: {}})
+        self.config = {self.name: {}}
         self['path'] = os.path.join(path, self.name)
         self['created'] = '%s/%s/%s, %s:%s:%s' % tuple(now_str)
         self.path = self['path']
         self.created = self['created']
-        # Get path to the bp file :
-        bp_path = self._path_bpsettings()
-        update_json(bp_path, self.config)
-        # Check that the entry is added :
-        cfg = load_json(bp_path)
-        assert self.name in cfg.keys()
-        assert all([k in cfg[self.name].keys() for k in ('path', 'created')])
+        # Register the study (a concurrent process may have added it) :
+        if not self._registry.add(self.name, self.config[self.name]):
+            logger.warning("%s already exist. Use a different name or "
+                           "delete it before" % self.name)
+            return None
         logger.info('    %s successfully created' % self.name)
 
     def delete(self):
@@ -148,18 +197,22 @@ class Study(object):
         user_input = input()
         if user_input is 'y':
             assert os.path.isdir(self.path)
-            bp_path = self._path_bpsettings()
             rmtree(self['path'])
+            forget_folder(self['path'])
+            self._registry.remove(self.name)
             del self.config[self.name]
-            save_json(bp_path, self.config)
             logger.info('%s has been deleted.' % self.name)
 
     # -------------------------------------------------------------
     # Manage Files:
     # -------------------------------------------------------------
+    @iostats.timed('search', lambda args, kwargs, out: (os.path.join(
+        args[0].path, kwargs.get('folder', ''), ''), 0))
     def search(self, *args, folder='', intersection=True, case=True,
                full_path=True, sort=True, exclude=None, split=None,
-               load=False, verbose=None):
+               load=False, mode='str', recursive=False, max_depth=None,
+               include_folders=None, exclude_folders=None, n_jobs=8,
+               verbose=None):
         """Get a list of files.
 
         Parameters
@@ -184,7 +237,29 @@ class Study(object):
         split : int | None
             Split the returned list of filst into smaller list.
         load : bool | False
-            Load the file if len(files) == 1.
+            Load the files. If a single file is found, the loaded file is
+            returned. Otherwise, a list of loaded files is returned (see
+            :meth:`load_many`).
+        mode : {'str', 'regex', 'glob'}
+            Type of the search patterns. Use 'str' (default) for plain
+            sub-strings, 'regex' for regular expressions or 'glob' for
+            shell-style wildcards matched against the full file name.
+        recursive : bool | False
+            Search files inside the sub-folders of `folder`. In that case,
+            patterns are matched against the name of the files and returned
+            files are relative to `folder` (if `full_path` is False).
+        max_depth : int | None
+            Maximum depth of the recursive search (0 means `folder` only).
+            By default, the whole tree is traversed.
+        include_folders : list | None
+            Names of the sub-folders to traverse (shell-style wildcards are
+            supported). By default, every sub-folder is traversed.
+        exclude_folders : list | None
+            Names of the sub-folders to skip (shell-style wildcards are
+            supported).
+        n_jobs : int | 8
+            Number of threads listing the sub-folders during a recursive
+            search.
 
         Returns
         -------
@@ -194,32 +269,28 @@ class Study(object):
         set_log_level(verbose)
         # Get path and files in the folder :
         dir_path = os.path.join(self.path, folder)
-        assert os.path.isdir(dir_path)
-        def_file = os.listdir(dir_path)
-        # Case sentitive (or not) :
-        if not case:
-            dir_file = [k.lower() for k in def_file]
-            args = [k.lower() for k in args]
+        assert (self._snapshot is not None) or os.path.isdir(dir_path)
+        # Filter files (all patterns are compiled into one expression) :
+        matcher = FileMatcher(args, mode=mode, intersection=intersection,
+                              case=case)
+        if recursive:
+            def_file = scan_tree(dir_path, max_depth=max_depth,
+                                 include=include_folders,
+                                 exclude=exclude_folders, n_jobs=n_jobs)
+            files = [k for k in def_file if matcher(os.path.basename(k))]
         else:
-            dir_file = def_file
-
-        if not len(args):
-            files = dir_file
-        else:
-            if intersection:
-                files = self._search_files(def_file, dir_file, args,
-                                           intersection)
-            else:
-                files = []
-                for a in args:
-                    files += self._search_files(def_file, dir_file, [a],
-                                                intersection)
-                sort = False
+            def_file = self._listdir(folder)
+            files = matcher.filter(def_file)
 
         # Exclude files :
         if isinstance(exclude, (list, tuple, np.ndarray)):
-            files = [k for k in files if k not in exclude]
-        logger.info("    %i files found : %s" % (len(files), ', '.join(files)))
+            files = [k for k in files if (k not in exclude) and (
+                os.path.basename(k) not in exclude)]
+        # exclude files being written and lock files
+        files = [f for f in files if not is_temporary(f)]
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("    %i files found : %s", len(files),
+                        ', '.join(files))
         # Full path :
         if full_path:
             files = [os.path.join(dir_path, k) for k in files]
@@ -230,29 +301,124 @@ class Study(object):
         if isinstance(split, int):
             split = -1 if split >= len(files) else split
             split = len(files) if split == -1 else split
-            files = [k.tolist() for k in np.array_split(files, split)]
-        # exclude 'lock.' files
-
-        files = [f for f in files if 'lock.' not in f]
+            files = _split_list(files, split)
         # Load :
         if load:
-            if len(files) > 1:
-                raise IOError("Can only load files if len(files) == 1. "
-                              "Files found : %s" % '\n'.join(files))
-            return self.load(files[0], folder=folder)
+            if len(files) == 1:
+                return self.load(files[0], folder=folder)
+            return self.load_many(files, folder=folder)
         else:
             return files
 
-    @staticmethod
-    def _search_files(def_file, dir_file, args, intersection):
-        """Get the list of files according to string patterns."""
-        n_files, n_args = len(dir_file), len(args)
-        filter_feat = np.zeros((n_files, n_args), dtype=bool)
-        for i, k in product(range(n_files), range(n_args)):
-            filter_feat[i, k] = bool(dir_file[i].find(args[k]) + 1)
-        fcn = np.all if intersection else np.any
-        is_searched = fcn(filter_feat, 1)
-        return [k for k, i in zip(def_file, is_searched) if i]
+    def iter_search(self, *args, folder='', intersection=True, case=True,
+                    full_path=True, exclude=None, mode='str', chunksize=None,
+                    recursive=False, max_depth=None, include_folders=None,
+                    exclude_folders=None):
+        """Iterate over the files matching search patterns.
+
+        Contrary to :meth:`search`, files are yielded while the folder is
+        scanned and the full list of files is never built. Files are yielded
+        in the order of the directory listing (i.e not sorted). As in
+        :meth:`search`, sub-folders matching the patterns are yielded by a
+        non-recursive search, and only files by a recursive one.
+
+        Parameters
+        ----------
+        args : string
+            Add some filters to get a restricted list of files,
+            according to the defined filters
+        folder : string | ''
+            Define a folder to search.
+        intersection : bool | True
+            Specify if the intersection should be considered across search
+            patterns or the union.
+        case : bool | True
+            Define if the search method have to take care of the case.
+        full_path : bool | True
+            Get files with full path (True) or only file names (False).
+        exclude : list | None
+            Exclude a list of files.
+        mode : {'str', 'regex', 'glob'}
+            Type of the search patterns.
+        chunksize : int | None
+            If an integer is given, lists of (at most) `chunksize` files are
+            yielded instead of single files.
+        recursive : bool | False
+            Search files inside the sub-folders of `folder`.
+        max_depth : int | None
+            Maximum depth of the recursive search.
+        include_folders : list | None
+            Names of the sub-folders to traverse.
+        exclude_folders : list | None
+            Names of the sub-folders to skip.
+
+        Yields
+        ------
+        file : string | list
+            A file (or a list of files if `chunksize` is given).
+        """
+        dir_path = os.path.join(self.path, folder)
+        assert os.path.isdir(dir_path)
+        if isinstance(chunksize, int):
+            assert chunksize > 0
+            chunk = []
+            for file in self.iter_search(
+                    *args, folder=folder, intersection=intersection,
+                    case=case, full_path=full_path, exclude=exclude,
+                    mode=mode, recursive=recursive, max_depth=max_depth,
+                    include_folders=include_folders,
+                    exclude_folders=exclude_folders):
+                chunk.append(file)
+                if len(chunk) == chunksize:
+                    yield chunk
+                    chunk = []
+            if len(chunk):
+                yield chunk
+            return
+        matcher = FileMatcher(args, mode=mode, intersection=intersection,
+                              case=case)
+        exclude = exclude if isinstance(exclude, (list, tuple,
+                                                  np.ndarray)) else []
+        exclude = set(exclude)
+        if recursive:
+            files = iter_tree(dir_path, max_depth=max_depth,
+                              include=include_folders,
+                              exclude=exclude_folders)
+        elif self._use_index or (self._snapshot is not None):
+            files = iter(self._listdir(folder))
+        else:
+            files = iter_dir(dir_path)
+        for file in files:
+            name = os.path.basename(file)
+            if (not matcher(name)) or is_temporary(name) or (
+                    file in exclude) or (name in exclude):
+                continue
+            yield os.path.join(dir_path, file) if full_path else file
+
+    def reindex(self, folder=None):
+        """Force the update of the index of files.
+
+        Parameters
+        ----------
+        folder : string | None
+            Folder to re-index. If None, every indexed folder is updated.
+        """
+        self._get_index().reindex(folder)
+
+    def _get_index(self):
+        """Get the index of files of the study."""
+        if self._index is None:
+            self._index = FileIndex(self.path)
+        return self._index
+
+    def _listdir(self, folder):
+        """List the files of a folder, using the index (or the shared
+        snapshot) if needed."""
+        if self._snapshot is not None:
+            return self._snapshot.listdir(os.path.join(self.path, folder))
+        if self._use_index:
+            return self._get_index().listdir(folder)
+        return os.listdir(os.path.join(self.path, folder))
 
     def path_to_folder(self, folder, force=False):
         """Get the path to a folder.
@@ -265,8 +431,8 @@ class Study(object):
             Force the creation if doesn't exist.
         """
         path = os.path.join(self.path, folder)
-        if not os.path.isdir(path) and force:
-            self._bpfolders(path)
+        if force:
+            makedirs(path, remember=self._snapshot is not None)
         return path
 
     def add_folder(self, name):
@@ -286,7 +452,9 @@ class Study(object):
         logger.info("    Folder %s added" % name)
         return full_path
 
-    def load(self, file, folder=None, verbose=None):
+    def load(self, file, folder=None, lazy=False, mmap_mode=None,
+             variables=None, columns=None, filters=None, chunksize=None,
+             slices=None, chunk_cache=None, verbose=None):
         """Load a file.
 
         This method support to load :
@@ -296,6 +464,9 @@ class Study(object):
             * .npy and .npz
             * .json
             * .txt
+            * .h5 and .hdf5
+            * .parquet and .feather (pandas DataFrame)
+            * .csv, .xls and .xlsx (pandas DataFrame)
 
         Parameter
         ---------
@@ -304,6 +475,35 @@ class Study(object):
         folder : string | None
             Specify where the file is located. If `folder` is None, full path
             should be given.
+        lazy : bool | False
+            Don't load the data in memory. .npy arrays are memory-mapped.
+            Unless `variables` or `slices` are given, .npz files always give
+            access to each array on demand and HDF5 files give sliceable
+            datasets (see :func:`pathta.rwio.load_file`). These files should
+            be closed after use.
+        mmap_mode : {None, 'r', 'r+', 'c'}
+            Memory-map .npy arrays (e.g 'r' to read a large array without
+            loading it).
+        variables : list | None
+            Only load a subset of variables of .mat, .npz and HDF5 files.
+        columns : list | None
+            Only load a subset of columns of .parquet, .feather and .csv
+            files.
+        filters : list | None
+            Row filters of .parquet and .feather files, applied while reading
+            (e.g [('subject', '==', 1), ('rt', '<', 1.5)], see
+            `pandas.read_parquet`).
+        chunksize : int | None
+            For .txt and .csv files, return an iterator over blocks of
+            `chunksize` lines instead of loading the whole file. Large files
+            are otherwise parsed in parallel.
+        slices : tuple | dict | None
+            Only read a selection of the datasets of HDF5 files, either the
+            same for every dataset (e.g (slice(None), slice(1000, 2000))) or
+            a dictionary {dataset: selection}. Only the chunks touched by the
+            selection are read from the disk.
+        chunk_cache : int | None
+            Size (in bytes) of the chunk cache of HDF5 datasets.
 
         Returns
         -------
@@ -313,11 +513,168 @@ class Study(object):
         set_log_level(verbose)
         folder = '' if not isinstance(folder, str) else folder
         full_path = os.path.join(self.path, folder, file)
-        arch = load_file(full_path)
-        logger.info('    %s loaded' % file)
+        arch = self._load_path(full_path, lazy=lazy, mmap_mode=mmap_mode,
+                               variables=variables, columns=columns,
+                               filters=filters, chunksize=chunksize,
+                               slices=slices, chunk_cache=chunk_cache)
+        logger.info('    %s loaded', file)
+        return arch
+
+    def load_many(self, files, folder=None, n_jobs=None, backend='thread',
+                  max_in_flight=None, verbose=None, **kwargs):
+        """Load several files concurrently.
+
+        Parameters
+        ----------
+        files : list
+            List of file names (or full paths if `folder` is None).
+        folder : string | None
+            Specify where the files are located.
+        n_jobs : int | None
+            Number of workers. By default, all of the CPUs are used.
+        backend : {'thread', 'process'}
+            Load the files on a pool of threads or processes. Threads are
+            usually enough since reading files releases the GIL. Processes
+            should be used for formats which are parsed in Python (e.g .mat,
+            .txt).
+        max_in_flight : int | None
+            Maximum number of files being loaded at the same time. By
+            default, twice the number of workers.
+        kwargs : dict | {}
+            Additional arguments are passed to :meth:`load` (e.g variables,
+            columns). Lazy loading is only supported by the 'thread' backend :
+            with the 'process' backend, .npz and HDF5 files are fully read
+            by the workers and returned as dictionaries.
+
+        Returns
+        -------
+        arch : list
+            List of loaded files, in the same order as `files`.
+        """
+        set_log_level(verbose)
+        folder = '' if not isinstance(folder, str) else folder
+        full_paths = [os.path.join(self.path, folder, k) for k in files]
+        if backend == 'process':
+            assert not (kwargs.get('lazy') or kwargs.get('mmap_mode') or (
+                kwargs.get('chunksize'))), (
+                "Lazy loading is not supported by the 'process' backend")
+            fcn = partial(_load_in_memory, **kwargs)
+        else:
+            fcn = partial(self._load_path, **kwargs)
+        arch = list(bounded_map(fcn, full_paths, n_jobs=n_jobs,
+                                backend=backend,
+                                max_in_flight=max_in_flight))
+        logger.info('    %i files loaded', len(arch))
         return arch
 
-    def save(self, file, *arg, folder=None, compress=False, **kwargs):
+    def map(self, func, *patterns, folder='', out_folder=None, out_ext=None,
+            n_jobs=None, backend='process', max_in_flight=None,
+            overwrite=False, load_kwargs=None, save_kwargs=None,
+            verbose=None):
+        """Load files, apply a function and save the outputs in a folder.
+
+        Files of `folder` matching the patterns are processed concurrently :
+        each one is loaded, given to `func` and its output is saved with the
+        same name in `out_folder`. At most `max_in_flight` files are
+        processed (and kept in memory) at the same time. Errors are reported
+        for each file without stopping the others.
+
+        Parameters
+        ----------
+        func : callable
+            Function applied to the loaded data. If it returns a dict, its
+            items are saved as variables (e.g .npz, .mat, .h5, .json), a tuple
+            is saved as several arguments, otherwise the output is saved as
+            a single argument (e.g .npy, .pickle). Outputs which can't be
+            saved with the extension of the output (e.g an array in a .mat
+            file) are reported as failed. It should be picklable (i.e
+            defined at the top level of a module) with the 'process'
+            backend.
+        patterns : string
+            Patterns of the files to process (see :meth:`search`).
+        folder : string | ''
+            Folder of the input files.
+        out_folder : string
+            Folder where outputs are saved (created if needed).
+        out_ext : string | None
+            Extension of the outputs (e.g '.npz'). By default, the extension
+            of the inputs.
+        n_jobs : int | None
+            Number of workers. By default, all of the CPUs are used.
+        backend : {'process', 'thread'}
+            Process the files on a pool of processes or threads.
+        max_in_flight : int | None
+            Maximum number of files being processed at the same time. By
+            default, twice the number of workers.
+        overwrite : bool | False
+            Process the files whose output is newer than the input. By
+            default, they are skipped.
+        load_kwargs, save_kwargs : dict | None
+            Additional arguments of :func:`pathta.rwio.load_file` and
+            :func:`pathta.rwio.save_file`.
+
+        Returns
+        -------
+        report : list
+            List of dictionaries (one per input file) with the 'file', its
+            'output', the 'status' ('done', 'skipped' or 'failed') and the
+            'error' (traceback of the failure or None).
+
+        Examples
+        --------
+        >>> report = st.map(compute_pow, 'subject_', '.npy', folder='raw',
+        >>>                 out_folder='pow', out_ext='.npz')
+        >>> failed = [k for k in report if k['status'] == 'failed']
+        """
+        assert isinstance(out_folder, str), "out_folder should be given"
+        files = self.search(*patterns, folder=folder, full_path=False,
+                            verbose=False)
+        set_log_level(verbose)
+        in_path = os.path.join(self.path, folder)
+        out_path = self.path_to_folder(out_folder, force=True)
+        report, todo = [], []
+        for file in files:
+            out_file = file if out_ext is None else (
+                os.path.splitext(file)[0] + out_ext)
+            item = dict(file=os.path.join(in_path, file),
+                        output=os.path.join(out_path, out_file),
+                        status='skipped', error=None)
+            report.append(item)
+            if overwrite or not _is_newer(item['output'], item['file']):
+                todo.append(item)
+        fcn = partial(_map_item, func, load_kwargs=load_kwargs,
+                      save_kwargs=save_kwargs)
+        items = [(k['file'], k['output']) for k in todo]
+        for item, (status, error) in zip(todo, bounded_map(
+                fcn, items, n_jobs=n_jobs, backend=backend,
+                max_in_flight=max_in_flight)):
+            item['status'], item['error'] = status, error
+            if status == 'failed':
+                logger.error("    %s failed : %s" % (item['file'],
+                                                     error.splitlines()[-1]))
+            elif self._cache is not None:
+                self._cache.invalidate(item['output'])
+        if (self._snapshot is not None) and len(todo):
+            self._snapshot.invalidate(out_path)
+        n_failed = len([k for k in todo if k['status'] == 'failed'])
+        logger.info("    %i files processed, %i skipped, %i failed" % (
+            len(todo) - n_failed, len(report) - len(todo), n_failed))
+        return report
+
+    def _load_path(self, full_path, **kwargs):
+        """Load a file, using the cache if needed.
+
+        Only full (non-lazy) loads of files are cached : any option which is
+        not None or False (including an empty selection, e.g variables=[])
+        bypasses the cache.
+        """
+        full = all([(v is None) or (v is False) for v in kwargs.values()])
+        if (self._cache is not None) and full:
+            return self._cache.get(full_path, load_file)
+        return load_file(full_path, **kwargs)
+
+    def save(self, file, *arg, folder=None, compress=False, level=None,
+             chunks=None, background=False, duplicate='increment', **kwargs):
         """Save a file.
 
         This method support to save :
@@ -326,6 +683,9 @@ class Study(object):
             * .pickle
             * .npy and .npz
             * .json
+            * .h5 and .hdf5 (arrays given as `kwargs`)
+            * .parquet and .feather (pandas DataFrame given as `args`)
+            * .xlsx (pandas DataFrame given as `args`)
 
         Parameters
         ----------
@@ -334,15 +694,297 @@ class Study(object):
         folder : string | None
             Specify where the file need to be saved. If `folder` is None, full
             path should be given.
+        compress : bool | {'zstd', 'lz4', 'zlib'}
+            Compress the file. .npz files only support zlib compression
+            (True). .npy and .pickle files can be compressed with any codec,
+            in parallel (zstd and lz4 require the zstandard and lz4
+            packages). Compressed files are detected by :meth:`load`.
+            .parquet and .feather files use their own compression (True
+            means zstd). HDF5 files support the 'gzip' (True) and 'lzf'
+            filters and .mat files the zlib compression of Matlab (True).
+            It is ignored, with a warning, for .json and .xlsx files.
+        level : int | None
+            Compression level of the codec.
+        chunks : bool | tuple | dict | None
+            Chunk shape of the datasets of HDF5 files (True for an automatic
+            shape, a tuple or a dictionary {dataset: shape}). Chunks should
+            follow the way the data is read (e.g (n_trials, 1, n_times) to
+            read one channel at a time).
+        background : bool | False
+            Write the file in a background thread. In that case, a future is
+            returned and the data should not be modified until the write is
+            done. Use :meth:`flush` to wait for the pending writes.
+        duplicate : {'increment', 'overwrite', 'fail'}
+            Behavior if the file already exists. Use 'increment' to add a
+            '(k)' suffix to the name, 'overwrite' to replace the existing file
+            or 'fail' to raise a FileExistsError. Files are always written to
+            a temporary file which is then renamed.
         args : tuple
-            Additional arguments for saving .npy arrays
+            Additional arguments for saving .npy arrays (or a single object
+            to pickle)
         kwargs : dict | {}
-            Additional arguments for saving .mat, .pickle, .npz and .json files
+            Additional arguments for saving .mat, .pickle, .npz, .json and
+            HDF5 files
+
+        Returns
+        -------
+        full_path : string | concurrent.futures.Future
+            Full path to the saved file (or a future giving this path if
+            `background` is True).
         """
         folder = '' if not isinstance(folder, str) else folder
         full_path = os.path.join(self.path, folder, file)
-        save_file(full_path, *arg, compress=compress, **kwargs)
-        logger.info("    %s saved" % full_path)
+        opts = dict(compress=compress, level=level, chunks=chunks,
+                    duplicate=duplicate)
+        if background:
+            if self._writer is None:
+                self.set_background()
+            nbytes = sizeof(arg) + sizeof(kwargs)
+            return self._writer.submit(self._save_path, nbytes, full_path,
+                                       arg, kwargs, opts)
+        return self._save_path(full_path, arg, kwargs, opts)
+
+    def _save_path(self, full_path, arg, kwargs, opts):
+        """Save a file and invalidate its cached version."""
+        full_path = save_file(full_path, *arg, **opts, **kwargs)
+        if self._cache is not None:
+            self._cache.invalidate(full_path)
+        if self._snapshot is not None:
+            self._snapshot.invalidate(os.path.dirname(full_path))
+        logger.info("    %s saved", full_path)
+        return full_path
+
+    def set_background(self, n_jobs=2, max_bytes=1e9):
+        """Configure the background writing of files.
+
+        Parameters
+        ----------
+        n_jobs : int | 2
+            Number of threads writing files.
+        max_bytes : int | 1e9
+            Maximum number of bytes pending to be written. Calls to
+            `save(..., background=True)` block while this budget is
+            exceeded.
+        """
+        if self._writer is not None:
+            self.flush()
+            self._writer.shutdown()
+        self._writer = BackgroundWriter(n_jobs=n_jobs, max_bytes=max_bytes)
+
+    def flush(self):
+        """Wait for the files saved in the background to be written.
+
+        Errors raised by the background writes are logged and the first one
+        is raised again.
+        """
+        if self._writer is None:
+            return None
+        errors = self._writer.flush()
+        for _, exc in errors:
+            logger.error("    Background save failed : %s" % repr(exc))
+        if len(errors):
+            raise errors[0][1]
+
+    # -------------------------------------------------------------
+    # Asynchronous I/O:
+    # -------------------------------------------------------------
+    def set_executor(self, executor=None, max_concurrency=None):
+        """Configure the execution of the asynchronous methods.
+
+        Asynchronous methods (:meth:`aload`, :meth:`asave`, :meth:`asearch`
+        and :meth:`aload_many`) run the synchronous methods in an executor
+        so that the event loop is never blocked.
+
+        Parameters
+        ----------
+        executor : concurrent.futures.Executor | None
+            Executor running the calls. It should be a thread pool (methods
+            of the study can't be sent to other processes). By default, a
+            pool of threads owned by the study is used.
+        max_concurrency : int | None
+            Maximum number of calls of this study running at the same time.
+            By default, the number of CPUs.
+        """
+        if self._executor is not None and self._own_executor:
+            self._executor.shutdown(wait=False)
+        self._own_executor = executor is None
+        self._executor = executor
+        self._max_concurrency = get_n_jobs(max_concurrency)
+        self._semaphores = WeakKeyDictionary()
+
+    async def _run_async(self, fcn, *args, **kwargs):
+        """Run a blocking call in the executor of the study.
+
+        If the awaiting task is cancelled before the call starts, the call
+        is never run. Once started, it runs until the end in its thread but
+        its result is discarded.
+        """
+        loop = asyncio.get_running_loop()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self._max_concurrency)
+            self._own_executor = True
+        # semaphores are bound to an event loop
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self._max_concurrency)
+            self._semaphores[loop] = semaphore
+        async with semaphore:
+            return await loop.run_in_executor(self._executor, partial(
+                fcn, *args, **kwargs))
+
+    async def aload(self, file, folder=None, **kwargs):
+        """Load a file without blocking the event loop.
+
+        Same parameters and output as :meth:`load`.
+        """
+        return await self._run_async(self.load, file, folder=folder,
+                                     **kwargs)
+
+    async def aload_many(self, files, folder=None, **kwargs):
+        """Load several files concurrently without blocking the event loop.
+
+        The number of files loaded at the same time is limited by the
+        concurrency of the study (see :meth:`set_executor`). If the task is
+        cancelled, files which are not being loaded yet are skipped.
+
+        Parameters
+        ----------
+        files : list
+            List of file names (or full paths if `folder` is None).
+        folder : string | None
+            Specify where the files are located.
+        kwargs : dict | {}
+            Additional arguments are passed to :meth:`load`.
+
+        Returns
+        -------
+        arch : list
+            List of loaded files, in the same order as `files`.
+        """
+        kwargs['verbose'] = kwargs.get('verbose', False)
+        tasks = [asyncio.ensure_future(self.aload(k, folder=folder,
+                                                  **kwargs)) for k in files]
+        try:
+            arch = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        logger.info('    %i files loaded', len(arch))
+        return list(arch)
+
+    async def asave(self, file, *arg, folder=None, **kwargs):
+        """Save a file without blocking the event loop.
+
+        Same parameters and output as :meth:`save` (except `background`).
+        The data should not be modified until the returned coroutine is
+        done.
+        """
+        assert not kwargs.get('background'), (
+            "asave can't be used with background=True")
+        return await self._run_async(self.save, file, *arg, folder=folder,
+                                     **kwargs)
+
+    async def asearch(self, *args, **kwargs):
+        """Search files without blocking the event loop.
+
+        Same parameters and output as :meth:`search`.
+        """
+        return await self._run_async(self.search, *args, **kwargs)
+
+    def open_writer(self, file, folder=None, dtype='float64', shape=(),
+                    duplicate='increment', **kwargs):
+        """Open a file to incrementally write an array larger than memory.
+
+        Chunks are appended along the first axis of the array with
+        `writer.append(chunk)`. The file can be read back with
+        `st.load(file, folder=folder, mmap_mode='r')` (.npy) or
+        `st.load(file, folder=folder, lazy=True)` (HDF5).
+
+        Parameters
+        ----------
+        file : string
+            Name of the file (.npy, .h5 or .hdf5).
+        folder : string | None
+            Specify where the file need to be saved.
+        dtype : string | 'float64'
+            Data type of the array.
+        shape : tuple | ()
+            Shape of a single row of the array (i.e without the first axis).
+        duplicate : {'increment', 'overwrite', 'fail'}
+            Behavior if the file already exists.
+        kwargs : dict | {}
+            Additional arguments are passed to h5py create_dataset (e.g
+            dataset='pow', compression='gzip').
+
+        Returns
+        -------
+        writer : pathta.writer.NpyWriter | pathta.writer.H5Writer
+            The writer. It should be closed after use (or used inside a
+            `with` block).
+
+        Examples
+        --------
+        >>> with st.open_writer('conn.npy', folder='conn', shape=(n,)) as w:
+        >>>     for trial in trials:
+        >>>         w.append(compute_conn(trial))
+        """
+        folder = '' if not isinstance(folder, str) else folder
+        full_path = os.path.join(self.path, folder, file)
+        writer = open_writer(full_path, dtype=dtype, shape=shape,
+                             duplicate=duplicate, **kwargs)
+        if self._cache is not None:
+            self._cache.invalidate(writer.name)
+        return writer
+
+    def array_store(self, name, shape=None, chunks=None, dtype='float64',
+                    folder=None, fill_value=0, compress=False, n_jobs=None):
+        """Open (or create) a chunked N-dimensional array of the study.
+
+        The array is stored in a folder with one file per chunk. Processes
+        can write different chunks in parallel without any lock and reading
+        a slice only reads the chunks it touches.
+
+        Parameters
+        ----------
+        name : string
+            Name of the array, relative to the study or to `folder` (e.g
+            'pow/subject_01').
+        shape : tuple | None
+            Shape of the array. Use None to open an existing array.
+        chunks : tuple | None
+            Shape of the chunks. Chunks should follow the way the array is
+            written and read (e.g (1, n_channels, n_times) to write one trial
+            at a time). By default, chunks of at most 4MB are used.
+        dtype : string | 'float64'
+            Data type of the array.
+        folder : string | None
+            Specify where the array is located.
+        fill_value : scalar | 0
+            Value of the chunks that have not been written.
+        compress : bool | {'zstd', 'lz4', 'zlib'}
+            Compress each chunk.
+        n_jobs : int | None
+            Number of threads reading and writing the chunks of a slice.
+
+        Returns
+        -------
+        store : pathta.store.ArrayStore
+            The array, which can be sliced like a numpy array.
+
+        Examples
+        --------
+        >>> pw = st.array_store('pow/subject_01', (n_trials, n_roi, n_times),
+        >>>                     chunks=(1, n_roi, n_times))
+        >>> pw[k] = compute_pow(k)  # in parallel processes
+        >>> roi = pw[:, 3, :]
+        """
+        folder = '' if not isinstance(folder, str) else folder
+        full_path = os.path.join(self.path, folder, name)
+        return ArrayStore(full_path, shape=shape, chunks=chunks, dtype=dtype,
+                          fill_value=fill_value, compress=compress,
+                          n_jobs=n_jobs)
 
     def load_config(self, file, entry=None):
         """Load a configuration file.
@@ -353,9 +995,15 @@ class Study(object):
             Name of the JSON config file.
         entry : str | None
             Entry in the config file.
+
+        Notes
+        -----
+        Parsed configuration files are kept in memory until they are
+        modified on disk.
         """
         assert '.json' in file
-        cfg = self.load(file, folder='config')
+        cfg = load_json(os.path.join(self.path, 'config', file), cached=True)
+        logger.info('    %s loaded' % file)
         if isinstance(entry, str) and (entry in cfg.keys()):
             return cfg[entry]
         else:
@@ -384,14 +1032,105 @@ class Study(object):
         kw : dict
             Dictionary to use for the update.
         backup : bool | True
-            Create a backup of the configuration to /study/backup/
+            Keep the history of the configuration in /study/backup/. Only
+            the modifications are stored (see :meth:`config_history` and
+            :meth:`config_version`).
         """
         assert '.json' in file
-        backup = self.path_to_folder('backup') if backup else None
+        backup = self.path_to_folder('backup', force=True) if backup else None
         full_path = os.path.join(self.path, 'config', file)
         update_json(full_path, kw, backup)
+        if self._cache is not None:
+            self._cache.invalidate(full_path)
         logger.info("    %s configuration file has been updated" % file)
 
+    def config_history(self, file):
+        """Get the history of the updates of a configuration file.
+
+        Parameters
+        ----------
+        file : string
+            Name of the JSON config file.
+
+        Returns
+        -------
+        history : list
+            List of dictionaries with the version number and the date of
+            each update. The version 0 is the file before its first update.
+        """
+        full_path = os.path.join(self.path, 'config', file)
+        return json_history(full_path, self.path_to_folder('backup'))
+
+    def config_version(self, file, version):
+        """Rebuild a past version of a configuration file.
+
+        Parameters
+        ----------
+        file : string
+            Name of the JSON config file.
+        version : int
+            Version to rebuild (see :meth:`config_history`). Use -1 for the
+            last version.
+
+        Returns
+        -------
+        config : dict
+            The configuration of this version.
+        """
+        full_path = os.path.join(self.path, 'config', file)
+        return json_version(full_path, self.path_to_folder('backup'), version)
+
+    def cache_info(self):
+        """Get the statistics of the cache of loaded files.
+
+        Returns
+        -------
+        info : dict
+            Dictionary with the number of hits, misses, evictions and cached
+            entries, the current size and the budget (in bytes). None if the
+            cache is disabled.
+        """
+        return self._cache.info() if self._cache is not None else None
+
+    def cache_clear(self):
+        """Remove every file of the cache of loaded files."""
+        if self._cache is not None:
+            self._cache.clear()
+
+    def memoize(self, folder='cache', max_bytes=None, max_age=None):
+        """Decorator caching the outputs of a function on disk.
+
+        Outputs are stored in the `memoize/` sub-folder of `folder` and are
+        reused by any process calling the function with the same arguments.
+        The key of a call is a hash of the source code of the function and
+        of its arguments (numpy arrays are hashed by content).
+
+        Parameters
+        ----------
+        folder : string | 'cache'
+            Folder of the study where outputs are stored.
+        max_bytes : int | None
+            Maximum size of the stored outputs. Least recently used outputs
+            are removed when it is exceeded.
+        max_age : float | None
+            Maximum age (in seconds) of the stored outputs since their last
+            use.
+
+        Returns
+        -------
+        decorator : pathta.memoize.DiskMemoize
+            The decorator.
+
+        Examples
+        --------
+        >>> @st.memoize(folder='cache', max_bytes=10e9)
+        >>> def compute_tf(x, freqs):
+        >>>     ...
+        """
+        path = os.path.join(self.path_to_folder(folder, force=True),
+                            'memoize')
+        return DiskMemoize(path, max_bytes=max_bytes, max_age=max_age)
+
     def load_script(self, filename):
         """Load a script.
 
@@ -461,57 +1200,292 @@ class Study(object):
                 pdf.savefig(fig, **kwargs)
                 plt.close()
 
-    def runtime(self, save=True, verbose=None):
-        """Computes and save how long a function takes to execute.
+    def timer(self, name, save=True):
+        """Time a stage of an analysis.
+
+        The timer records the wall time and the CPU time of the stage, the
+        resident memory of the process at its start and at its end, and the
+        peak memory of the process so far. It can be used as a context
+        manager or as a decorator and timers can be nested (the stage is
+        then named 'parent/child').
+        Timings are logged at the PROFILER level and records are appended to
+        cache/profile.jsonl (see :meth:`profile_report`).
+
+        Parameters
+        ----------
+        name : string
+            Name of the stage.
+        save : bool | True
+            Append the records to cache/profile.jsonl.
+
+        Returns
+        -------
+        timer : pathta.profiler.Timer
+            The timer.
+
+        Examples
+        --------
+        >>> with st.timer('pow'):
+        >>>     with st.timer('load'):
+        >>>         data = st.load('data.npy', folder='raw')
+        >>> @st.timer('conn')
+        >>> def compute_conn(x):
+        >>>     ...
+        """
+        path = self.join('profile.jsonl', folder='cache', force=True) if (
+            save) else None
+        return Timer(name, path=path)
+
+    def profile_report(self, script=None, last=None, verbose=None):
+        """Summarise the timings of the stages recorded by :meth:`timer`.
+
+        Parameters
+        ----------
+        script : string | None
+            Only summarise the stages of a script.
+        last : int | None
+            Only summarise the last runs.
+
+        Returns
+        -------
+        report : pandas.DataFrame
+            Number of runs and calls, total, mean, min and max wall time,
+            mean CPU time, maximum memory growth and peak memory of the
+            process (MB) of each stage of each script, sorted by decreasing
+            total wall time.
         """
-        from datetime import date
-        hist_file = 'runtime.txt'
-        date_format = "%d/%m/%Y %H:%M:%S"
         set_log_level(verbose)
+        path = os.path.join(self.path, 'cache', 'profile.jsonl')
+        report = profile_report(path, script=script, last=last)
+        logger.info("    Profile of %i stages" % len(report))
+        return report
 
-        if not hasattr(self, '_runtime_past'):
-            self._runtime_script = sys.argv[0]
-            self._runtime_past = datetime.now()
-            line = self._runtime_past.strftime(date_format)
-            logger.info(f'    Start timer : {line}')
-        else:
-            if save:
-                path = self.join(hist_file, folder='cache', force=True)
-                mode = "a+" if os.path.isfile(path) else "w+"
-                f = open(path, mode)
-                # define an instantaneous datetime
-                now = datetime.now()
-                # get past and today dates and deltatime
-                past_date = self._runtime_past.strftime(date_format)
-                now_date = now.strftime(date_format)
-                elapsed = now - self._runtime_past
-                # define the string to write
-                line = (f"{past_date}\t{now_date}\t{self._runtime_script}"
-                        f"\t{elapsed}\r\n")
+    def io_stats(self, enable=None, reset=False, export=None):
+        """Get the statistics of the I/O operations.
+
+        Loads, saves and searches are counted per extension and per folder,
+        with the number of bytes read or written and a histogram of their
+        latencies. Statistics are disabled by default and are shared by
+        every study of the process (operations run in other processes are
+        not counted).
+
+        Parameters
+        ----------
+        enable : bool | None
+            Enable (True) or disable (False) the collection of statistics.
+            They can also be enabled with the `PATHTA_IOSTATS=1` environment
+            variable.
+        reset : bool | False
+            Reset the statistics after reading them.
+        export : string | None
+            Export the statistics to a .json or a .csv file. Relative names
+            are saved in the cache/ folder of the study.
+
+        Returns
+        -------
+        stats : pandas.DataFrame
+            Number of calls, number of partial reads (lazy, memory-mapped
+            or selective loads, whose bytes are not counted), bytes, total
+            and mean time (in seconds) and number of calls per latency bin,
+            for each operation, extension and folder (relative to the study
+            when possible).
+        """
+        import pandas as pd
+
+        if enable is not None:
+            iostats.enable(enable)
+        stats = iostats.get_stats(reset=reset)
+        for row in stats:
+            if row['folder'].startswith(self.path):
+                row['folder'] = os.path.relpath(row['folder'], self.path)
+        if isinstance(export, str):
+            if not os.path.isabs(export):
+                export = self.join(export, folder='cache', force=True)
+            iostats.export(stats, export)
+            logger.info("    I/O statistics exported to %s" % export)
+        return pd.DataFrame(stats, columns=['op', 'ext', 'folder', 'calls',
+                                            'partial', 'bytes', 'time',
+                                            'time_mean'] +
+                            list(iostats.HIST_LABELS))
+
+    def manifest(self, n_jobs=None, verbose=None):
+        """Get the manifest of the files of the study.
+
+        The manifest contains the size, the modification time and the
+        sha256 hash of every file (except the ones of the cache/ folder). It
+        is stored in cache/manifest.json and only the files whose size or
+        modification time changed since the last manifest are hashed again.
+
+        Parameters
+        ----------
+        n_jobs : int | None
+            Number of threads hashing files. By default, all of the CPUs.
+
+        Returns
+        -------
+        manifest : dict
+            Dictionary {file: {'size', 'mtime_ns', 'sha256'}}, where files
+            are relative to the study (with '/' separators).
+        """
+        set_log_level(verbose)
+        manifest = build_manifest(self.path, load_manifest(self.path),
+                                  n_jobs=n_jobs)
+        save_manifest(self.path, manifest)
+        logger.info("    Manifest of %i files" % len(manifest))
+        return manifest
+
+    def sync_to(self, other_root, delete=False, n_jobs=None, verbose=None):
+        """Copy the files of the study which differ in another location.
+
+        The manifests of the study and of its copy are compared, so that
+        only missing or modified files are copied. Files are copied in
+        parallel, atomically (temporary file and rename) and keep their
+        modification time.
+
+        Parameters
+        ----------
+        other_root : string
+            Folder containing the copy of the study (i.e the files are
+            copied to `other_root/<name of the study>`).
+        delete : bool | False
+            Remove the files of the copy which don't exist in the study.
+        n_jobs : int | None
+            Number of threads. By default, all of the CPUs.
+
+        Returns
+        -------
+        report : dict
+            Lists of the 'copied', 'deleted' and 'unchanged' files.
+        """
+        set_log_level(verbose)
+        dst_root = os.path.join(other_root, self.name)
+        report = sync(self.path, dst_root, delete=delete, n_jobs=n_jobs)
+        logger.info("    %i files copied to %s (%i unchanged, %i deleted)" % (
+            len(report['copied']), dst_root, len(report['unchanged']),
+            len(report['deleted'])))
+        return report
+
+    def runtime(self, save=True, verbose=None):
+        """Time a script between two calls.
+
+        The first call starts a 'runtime' :class:`pathta.profiler.Timer`
+        (stages timed in between are named 'runtime/<stage>') and the
+        second one stops it. The record is appended to cache/profile.jsonl
+        (see :meth:`profile_report`) and a line with the start and end
+        dates, the script and the elapsed time is appended to
+        cache/runtime.txt. A third call starts a new timer.
+
+        Parameters
+        ----------
+        save : bool | True
+            Save the record when stopping the timer.
+        """
+        set_log_level(verbose)
+        date_format = "%d/%m/%Y %H:%M:%S"
+        timer = getattr(self, '_runtime_timer', None)
+        if timer is None:
+            self._runtime_timer = Timer('runtime').__enter__()
+            logger.info("    Start timer : %s" % datetime.now().strftime(
+                date_format))
+            return
+        del self._runtime_timer
+        timer.__exit__(None, None, None)
+        record = timer.record
+        elapsed = timedelta(seconds=record['wall'])
+        if save:
+            write_record(self.join('profile.jsonl', folder='cache',
+                                   force=True), record)
+            start = datetime.fromisoformat(record['start'])
+            line = "%s\t%s\t%s\t%s\r\n" % (
+                start.strftime(date_format), (start + elapsed).strftime(
+                    date_format), record['script'], elapsed)
+            with open(self.join('runtime.txt', folder='cache'), 'a') as f:
                 f.write(line)
-                f.close()
-                logger.info(f"    Elapsed time : {elapsed}")
+        logger.info("    Elapsed time : %s" % elapsed)
 
     @property
     def studies(self):
-        """Get doc."""
-        bp_path = self._path_bpsettings()
-        return load_json(bp_path).keys()
+        """Get the names of the registered studies."""
+        return self._registry.names()
 
     def _bpfolders(self, directory):
         """Check if a folder exist otherwise, create it."""
-        if not os.path.exists(directory):
-            os.makedirs(directory)
+        makedirs(directory, remember=self._snapshot is not None)
 
     def _load_bpsettings(self):
-        """Load the bpsettings file."""
-        return load_json(self._path_bpsettings())
+        """Load the registry of studies."""
+        return self._registry.load()
 
     def _path_bpsettings(self):
         """Get the path of bpsettings."""
-        dir_path = os.path.dirname(os.path.realpath(__file__))
-        bp_path = re.findall('(.*?)pathta', dir_path)[0]
-        return os.path.join(*(bp_path, 'pathta', BP_FILE))
+        return os.path.join(registry_folder(), BP_FILE)
+
+
+def _is_newer(file, other):
+    """Check if a file exists and is newer than another one."""
+    try:
+        return os.stat(file).st_mtime_ns >= os.stat(other).st_mtime_ns
+    except FileNotFoundError:
+        return False
+
+
+def _load_in_memory(name, **kwargs):
+    """Load a file in a worker process.
+
+    Open files (.npz and HDF5) can't be sent back to the parent process, so
+    that their content is read in a dictionary.
+    """
+    arch = load_file(name, **kwargs)
+    if not hasattr(arch, 'close'):
+        return arch
+    with arch:
+        if hasattr(arch, 'files'):  # NpzFile
+            return dict(arch)
+        from pathta.rwio import _read_h5
+        return _read_h5(arch)
+
+
+def _map_item(func, item, load_kwargs=None, save_kwargs=None):
+    """Load a file, apply a function and save its output (see Study.map).
+
+    Returns
+    -------
+    status : {'done', 'failed'}
+        Status of the item.
+    error : string | None
+        Traceback of the error.
+    """
+    in_file, out_file = item
+    load_kwargs, save_kwargs = load_kwargs or {}, save_kwargs or {}
+    try:
+        arch = load_file(in_file, **load_kwargs)
+        try:
+            out = func(arch)
+            if isinstance(out, dict):
+                save_file(out_file, duplicate='overwrite', **save_kwargs,
+                          **out)
+            else:
+                out = out if isinstance(out, tuple) else (out,)
+                save_file(out_file, *out, duplicate='overwrite',
+                          **save_kwargs)
+        finally:
+            if hasattr(arch, 'close'):  # e.g .npz and HDF5 files
+                arch.close()
+        return 'done', None
+    except Exception:
+        return 'failed', traceback.format_exc()
+
+
+def _split_list(lst, n):
+    """Split a list into n sub-lists of (almost) equal size."""
+    if not n:
+        return []
+    q, r = divmod(len(lst), n)
+    bounds = [0]
+    for k in range(n):
+        bounds.append(bounds[-1] + q + int(k < r))
+    return [lst[bounds[k]:bounds[k + 1]] for k in range(n)]
+
 
 if __name__ == '__main__':
     # define the name of your study
@@ -4,8 +4,12 @@ See :
 https://stackoverflow.com/questions/384076/how-can-i-color-python-logging-output
 """
 import logging
+import atexit
 import sys
 import re
+from copy import copy
+from queue import SimpleQueue
+from logging.handlers import QueueHandler, QueueListener
 
 from decorator import FunctionMaker
 
@@ -33,33 +37,48 @@ def formatter_message(message, use_color=True):
     return message.replace("$RESET", RESET_SEQ).replace("$BOLD", BOLD_SEQ)
 
 
+_STAR_RE = re.compile(r'\*.*?\*')
+_STAR_COLOR = (COLOR_SEQ % (30 + RED), COLOR_SEQ % (30 + WHITE) + RESET_SEQ)
+
+
+def _color_star(match):
+    return _STAR_COLOR[0] + match.group() + _STAR_COLOR[1]
+
+
 class _Formatter(logging.Formatter):
-    """Formatter."""
+    """Formatter.
+
+    The formatters of each format and the colored level names are built
+    once, and records are formatted without being modified.
+    """
 
     def __init__(self, format_type='compact'):
-        logging.Formatter.__init__(self, FORMAT[format_type])
+        logging.Formatter.__init__(self, formatter_message(
+            FORMAT[format_type]))
         self._format_type = format_type
+        self._print = logging.Formatter(FORMAT['print'])
+        self._levelnames = {k: COLOR_SEQ % (30 + v) + k + RESET_SEQ for k,
+                            v in COLORS.items()}
 
     def format(self, record):
-        name = record.levelname
         msg = record.getMessage()
         # If * in msg, set it in RED :
         if '*' in msg:
-            regexp = '\*.*?\*'
-            re_search = re.search(regexp, msg).group()
-            to_color = COLOR_SEQ % (30 + RED) + re_search + COLOR_SEQ % (
-                30 + WHITE) + RESET_SEQ
-            msg_color = re.sub(regexp, to_color, msg)
-            msg_color += RESET_SEQ
-            record.msg = msg_color
-        # Set level color :
-        levelname_color = COLOR_SEQ % (30 + COLORS[name]) + name + RESET_SEQ
-        record.levelname = levelname_color
-        if record.levelno == 20:
-            logging.Formatter.__init__(self, FORMAT['print'])
-        else:
-            logging.Formatter.__init__(self, FORMAT[self._format_type])
-        return formatter_message(logging.Formatter.format(self, record))
+            msg = _STAR_RE.sub(_color_star, msg) + RESET_SEQ
+        if (record.levelno == logging.INFO) and not (
+                record.exc_info or record.exc_text or record.stack_info):
+            return msg
+        # Format with the colored level name, then restore the record :
+        levelname, record_msg, args = record.levelname, record.msg, record.args
+        record.levelname = self._levelnames.get(levelname, levelname)
+        record.msg, record.args = msg, None
+        try:
+            if record.levelno == logging.INFO:
+                return self._print.format(record)
+            return logging.Formatter.format(self, record)
+        finally:
+            record.levelname, record.msg, record.args = (levelname,
+                                                         record_msg, args)
 
 
 class _StreamHandler(logging.StreamHandler):
@@ -69,26 +88,42 @@ class _StreamHandler(logging.StreamHandler):
         logging.StreamHandler.__init__(self, sys.stderr)
         self.setFormatter(_lf)
         self._str_pattern = None
-        self.emit = self._pathta_emit
+        self._re_pattern = None
 
-    def _pathta_emit(self, record, *args):
-        msg = record.getMessage()
-        test = self._match_pattern(record, msg)
+    def set_pattern(self, pattern):
+        """Only emit messages matching a pattern (None to emit any)."""
+        self._str_pattern = pattern
+        self._re_pattern = None if pattern is None else re.compile(pattern)
+
+    def emit(self, record):
+        if self._re_pattern is None:
+            return logging.StreamHandler.emit(self, record)
+        test = self._match_pattern(record, record.getMessage())
         if test:
-            record.msg = test
+            record = copy(record)
+            record.msg, record.args = test, None
             return logging.StreamHandler.emit(self, record)
-        else:
-            return
 
     def _match_pattern(self, record, message):
-        if isinstance(self._str_pattern, str):
-            if re.search(self._str_pattern, message):
-                sub = '*{}*'.format(self._str_pattern)
-                return re.sub(self._str_pattern, sub, message)
-            else:
-                return ''
-        else:
+        if self._re_pattern is None:
             return message
+        if self._re_pattern.search(message):
+            return self._re_pattern.sub(lambda m: '*%s*' % m.group(),
+                                        message)
+        return ''
+
+
+class _QueueHandler(QueueHandler):
+    """Queue handler deferring the formatting to the listener thread."""
+
+    def prepare(self, record):
+        if record.exc_info:
+            # tracebacks can't be formatted once the frames are gone
+            record = copy(record)
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+            record.exc_info = None
+        return record
 
 
 logger = logging.getLogger('pathta')
@@ -118,6 +153,9 @@ def set_log_level(verbose=None, match=None):
     This function comes from the PySurfer package. See :
     https://github.com/nipy/PySurfer/blob/master/surfer/utils.py
 
+    The level of the logger is only changed when it differs from the
+    current one, so that calling this function is cheap.
+
     Parameters
     ----------
     verbose : bool, str, int, or None
@@ -125,24 +163,63 @@ def set_log_level(verbose=None, match=None):
         PROFILER, DEBUG, INFO, WARNING, ERROR, or CRITICAL.
     match : string | None
         Filter logs using a string pattern.
+
+    Returns
+    -------
+    old_level : int
+        The previous level of the logger.
     """
-    # if verbose is None:
-    #     verbose = "INFO"
-    logger = logging.getLogger('pathta')
+    old_level = logger.level
     if isinstance(verbose, bool):
         verbose = 'INFO' if verbose else 'WARNING'
     if verbose is None:
         verbose = 'INFO'
     if isinstance(verbose, str):
-        if (verbose.upper() in LOGGING_TYPES):
-            verbose = verbose.upper()
-            verbose = LOGGING_TYPES[verbose]
-            logger.setLevel(verbose)
-        else:
+        level = LOGGING_TYPES.get(verbose.upper())
+        if level is None:
             raise ValueError("verbose must be in "
                              "%s" % ', '.join(LOGGING_TYPES))
+        verbose = level
+    if isinstance(verbose, int) and (verbose != old_level):
+        # setLevel clears the cache of every logger
+        logger.setLevel(verbose)
     if isinstance(match, str):
-        _lh._str_pattern = match
+        _lh.set_pattern(match)
+    return old_level
+
+
+_QUEUE = dict(handler=None, listener=None)
+
+
+def set_log_queue(enable=True):
+    """Format and write the logs on a background thread.
+
+    When enabled, logging a message only puts the record in a queue, which
+    is consumed by a listener thread writing to the terminal. Messages are
+    formatted when they are written, so that the arguments of a message
+    should not be modified after logging it.
+
+    Parameters
+    ----------
+    enable : bool | True
+        Enable or disable the background thread.
+    """
+    if enable and (_QUEUE['handler'] is None):
+        queue = SimpleQueue()
+        _QUEUE['handler'] = _QueueHandler(queue)
+        _QUEUE['listener'] = QueueListener(queue, _lh,
+                                           respect_handler_level=True)
+        _QUEUE['listener'].start()
+        logger.removeHandler(_lh)
+        logger.addHandler(_QUEUE['handler'])
+    elif not enable and (_QUEUE['handler'] is not None):
+        logger.removeHandler(_QUEUE['handler'])
+        logger.addHandler(_lh)
+        _QUEUE['listener'].stop()  # write the pending logs
+        _QUEUE['handler'] = _QUEUE['listener'] = None
+
+
+atexit.register(set_log_queue, False)
 
 
 class use_log_level(object):  # noqa
@@ -158,7 +235,7 @@ class use_log_level(object):  # noqa
         self.level = level
 
     def __enter__(self):  # noqa
-        self.old_level = set_log_level(self.level, True)
+        self.old_level = set_log_level(self.level)
 
     def __exit__(self, *args):  # noqa
         set_log_level(self.old_level)
@@ -0,0 +1,161 @@
+"""Fast loading of large text (.txt, .csv) files."""
+import os
+import io
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+from pathta.parallel import get_n_jobs
+
+
+PARALLEL_SIZE = 64 * 1024 * 1024  # files are split above this size
+QUOTE = b'"'
+
+
+class _Quoted(Exception):
+    """A block of lines contains quoted fields."""
+
+
+def _byte_ranges(name, n_chunks, start=0):
+    """Split a file into byte ranges ending on new lines."""
+    size = os.path.getsize(name)
+    bounds = [start]
+    with open(name, 'rb') as f:
+        for k in range(1, n_chunks):
+            pos = max(start + (size - start) * k // n_chunks, bounds[-1])
+            f.seek(pos)
+            f.readline()
+            if f.tell() >= size:
+                break
+            bounds.append(f.tell())
+    bounds.append(size)
+    return [(bounds[k], bounds[k + 1]) for k in range(len(bounds) - 1)]
+
+
+def _read_range(name, start, stop):
+    """Read a range of bytes of a file."""
+    with open(name, 'rb') as f:
+        f.seek(start)
+        return f.read(stop - start)
+
+
+def _header_size(name, header):
+    """Get the number of bytes of the header line."""
+    if header is None:
+        return 0
+    with open(name, 'rb') as f:
+        f.readline()
+        return f.tell()
+
+
+def load_text(name, delimiter=None, header='infer', columns=None, dtype=None,
+              comments=None, chunksize=None, n_jobs=None):
+    """Load a text file using the C parser of pandas.
+
+    Large files are split into blocks of lines which are parsed in parallel.
+    Types of the columns are inferred (on the first block), unless `dtype` is
+    given. Files containing quoted fields are parsed at once.
+
+    Parameters
+    ----------
+    name : string
+        Full path to the file.
+    delimiter : string | None
+        Column delimiter. By default, whitespaces for .txt files and ',' for
+        .csv files.
+    header : {'infer', None}
+        Use 'infer' if the first line contains the names of the columns.
+        By default, .txt files have no header.
+    columns : list | None
+        Only load a subset of columns.
+    dtype : type | dict | None
+        Type of the data (or of each column).
+    comments : string | None
+        Character marking the beginning of a comment. By default, lines are
+        not stripped, so that values containing '#' are kept intact.
+    chunksize : int | None
+        If an integer is given, an iterator over blocks of `chunksize` lines
+        is returned instead of the full data.
+    n_jobs : int | None
+        Number of threads parsing the file. By default, all of the CPUs are
+        used for files larger than 64MB.
+
+    Returns
+    -------
+    data : pandas.DataFrame | iterator
+        The loaded data (or an iterator over blocks of data).
+    """
+    import pandas as pd
+
+    if delimiter is None:
+        delimiter = ',' if name.endswith('.csv') else r'\s+'
+    kw = dict(sep=delimiter, usecols=columns, dtype=dtype, comment=comments,
+              engine='c')
+    if isinstance(chunksize, int):
+        return pd.read_csv(name, header=header, chunksize=chunksize, **kw)
+    n_jobs = get_n_jobs(n_jobs)
+    if (n_jobs == 1) or (os.path.getsize(name) < PARALLEL_SIZE):
+        return pd.read_csv(name, header=header, **kw)
+    # Get the names of the columns from the header
+    if header is None:
+        names = None
+    else:
+        names = list(pd.read_csv(name, header=header, nrows=0, sep=delimiter,
+                                 comment=comments, engine='c').columns)
+    ranges = _byte_ranges(name, n_jobs, start=_header_size(name, header))
+
+    def _parse(bounds, dtype):
+        data = _read_range(name, *bounds)
+        if QUOTE in data:
+            # quoted fields may contain new lines, blocks can't be split
+            raise _Quoted()
+        return pd.read_csv(io.BytesIO(data), header=None, names=names,
+                           **dict(kw, dtype=dtype))
+
+    # Types are inferred on the first block and used for the other ones, so
+    # that a column gets the same type in every block. Quoted files, or
+    # files whose types don't hold for every block, are parsed at once.
+    try:
+        first = _parse(ranges[0], dtype)
+        if dtype is None:
+            dtype = first.dtypes.to_dict()
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            blocks = list(executor.map(partial(_parse, dtype=dtype),
+                                       ranges[1:]))
+    except (_Quoted, ValueError):
+        return pd.read_csv(name, header=header, **kw)
+    return pd.concat([first] + blocks, ignore_index=True)
+
+
+def load_array(name, chunksize=None, **kwargs):
+    """Load a text file of numbers as a numpy array.
+
+    This is a faster replacement of np.genfromtxt (see :func:`load_text`).
+    As with np.genfromtxt, text following a '#' is ignored by default.
+
+    Parameters
+    ----------
+    name : string
+        Full path to the file.
+    chunksize : int | None
+        If an integer is given, an iterator over arrays of `chunksize` lines
+        is returned instead of the full array.
+    kwargs : dict | {}
+        Additional arguments are passed to :func:`load_text`.
+
+    Returns
+    -------
+    data : array_like | iterator
+        The loaded array (or an iterator over blocks of the array).
+    """
+    kwargs['header'] = kwargs.get('header', None)
+    kwargs['comments'] = kwargs.get('comments', '#')
+    data = load_text(name, chunksize=chunksize, **kwargs)
+    if isinstance(chunksize, int):
+        return (_to_array(k) for k in data)
+    return _to_array(data)
+
+
+def _to_array(df):
+    """Convert a DataFrame to an array, squeezing single columns."""
+    arr = df.to_numpy()
+    return arr[:, 0] if arr.ndim == 2 and arr.shape[1] == 1 else arr
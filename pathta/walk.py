@@ -0,0 +1,126 @@
+"""Recursive and parallel traversal of folders."""
+import os
+from fnmatch import fnmatch
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _scan_dir(path):
+    """List the files and sub-folders of a directory."""
+    files, dirs = [], []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                (dirs if is_dir else files).append(entry.name)
+    except (PermissionError, FileNotFoundError):
+        pass
+    return files, dirs
+
+
+def _keep_folder(name, include, exclude):
+    """Check if a sub-folder need to be traversed."""
+    if exclude and any([fnmatch(name, k) for k in exclude]):
+        return False
+    if include and not any([fnmatch(name, k) for k in include]):
+        return False
+    return True
+
+
+def scan_tree(root, max_depth=None, include=None, exclude=None, n_jobs=8):
+    """Recursively get the files contained in a folder.
+
+    Sub-folders of the same depth are listed concurrently on a thread pool,
+    which hides the latency of network mounts.
+
+    Parameters
+    ----------
+    root : string
+        Path to the folder to traverse.
+    max_depth : int | None
+        Maximum depth of the traversal. Use 0 to only consider the files of
+        the root folder. By default, the whole tree is traversed.
+    include : list | None
+        List of folder names (possibly with shell-style wildcards) to
+        traverse. By default, every sub-folder is traversed.
+    exclude : list | None
+        List of folder names (possibly with shell-style wildcards) to skip.
+    n_jobs : int | 8
+        Number of threads listing the folders.
+
+    Returns
+    -------
+    files : list
+        List of files, relative to the root folder.
+    """
+    include = [include] if isinstance(include, str) else include
+    exclude = [exclude] if isinstance(exclude, str) else exclude
+    files, level, depth = [], [''], 0
+    with ThreadPoolExecutor(max_workers=max(1, n_jobs)) as executor:
+        while len(level):
+            paths = [os.path.join(root, k) for k in level]
+            next_level = []
+            for rel, (l_files, l_dirs) in zip(level, executor.map(_scan_dir,
+                                                                  paths)):
+                files += [os.path.join(rel, k) for k in l_files]
+                if (max_depth is None) or (depth < max_depth):
+                    next_level += [os.path.join(rel, k) for k in l_dirs if
+                                   _keep_folder(k, include, exclude)]
+            level, depth = next_level, depth + 1
+    return files
+
+
+def iter_dir(path):
+    """Iterate over the names of the entries (files and sub-folders) of a
+    folder, as listed by `os.listdir`."""
+    with os.scandir(path) as it:
+        for entry in it:
+            yield entry.name
+
+
+def iter_tree(root, max_depth=None, include=None, exclude=None):
+    """Iterate over the files contained in a folder, recursively.
+
+    Contrary to :func:`scan_tree`, files are yielded as soon as their folder
+    is listed and the whole list of files is never built.
+
+    Parameters
+    ----------
+    root : string
+        Path to the folder to traverse.
+    max_depth : int | None
+        Maximum depth of the traversal. Use 0 to only consider the files of
+        the root folder. By default, the whole tree is traversed.
+    include : list | None
+        List of folder names (possibly with shell-style wildcards) to
+        traverse. By default, every sub-folder is traversed.
+    exclude : list | None
+        List of folder names (possibly with shell-style wildcards) to skip.
+
+    Yields
+    ------
+    file : string
+        File relative to the root folder.
+    """
+    include = [include] if isinstance(include, str) else include
+    exclude = [exclude] if isinstance(exclude, str) else exclude
+    stack = [('', 0)]
+    while len(stack):
+        rel, depth = stack.pop()
+        try:
+            it = os.scandir(os.path.join(root, rel))
+        except (PermissionError, FileNotFoundError):
+            continue
+        with it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if not is_dir:
+                    yield os.path.join(rel, entry.name)
+                elif ((max_depth is None) or (depth < max_depth)) and (
+                        _keep_folder(entry.name, include, exclude)):
+                    stack.append((os.path.join(rel, entry.name), depth + 1))
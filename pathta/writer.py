@@ -0,0 +1,195 @@
+"""Incrementally write arrays that are too large to be kept in memory."""
+import os
+import struct
+import logging
+
+from pathta.rwio import safety_save
+
+
+logger = logging.getLogger('pathta')
+
+NPY_MAGIC = b'\x93NUMPY\x01\x00'
+NPY_HEADER_LEN = 128  # fixed header length, large enough for any shape
+
+
+class _ArrayWriter(object):
+    """Base class of the array writers.
+
+    Chunks are appended along the first axis of the array, which grows as
+    chunks are written.
+    """
+
+    def __init__(self, name, dtype='float64', shape=()):  # noqa
+        import numpy as np
+        self.name = name
+        self.dtype = np.dtype(dtype)
+        self.shape_row = tuple(int(k) for k in shape)
+        self.n_rows = 0
+
+    @property
+    def shape(self):
+        """Get the current shape of the array on disk."""
+        return (self.n_rows,) + self.shape_row
+
+    def append(self, chunk):
+        """Append a chunk of data.
+
+        Parameters
+        ----------
+        chunk : array_like
+            Array of shape (n_rows, *shape) or a single row of shape `shape`.
+        """
+        import numpy as np
+        chunk = np.asarray(chunk, dtype=self.dtype)
+        if chunk.shape == self.shape_row:
+            chunk = chunk[np.newaxis, ...]
+        if chunk.shape[1:] != self.shape_row:
+            raise ValueError("Chunks should have a shape (n_rows, *%s), got "
+                             "%s" % (str(self.shape_row), str(chunk.shape)))
+        self._write(chunk)
+        self.n_rows += chunk.shape[0]
+
+    def __enter__(self):  # noqa
+        return self
+
+    def __exit__(self, *args):  # noqa
+        self.close()
+
+    def __repr__(self):
+        """Representation of the writer."""
+        return "<%s '%s' shape=%s dtype=%s>" % (
+            type(self).__name__, self.name, str(self.shape), str(self.dtype))
+
+    def _write(self, chunk):
+        raise NotImplementedError()
+
+    def close(self):
+        """Close the file."""
+        raise NotImplementedError()
+
+
+class NpyWriter(_ArrayWriter):
+    """Growable .npy file.
+
+    The header of the file is rewritten after each chunk so that the file can
+    be read (e.g memory-mapped) while being written.
+
+    Parameters
+    ----------
+    name : string
+        Full path to the .npy file.
+    dtype : string | 'float64'
+        Data type of the array.
+    shape : tuple | ()
+        Shape of a single row of the array (i.e without the first axis).
+    """
+
+    def __init__(self, name, dtype='float64', shape=()):  # noqa
+        _ArrayWriter.__init__(self, name, dtype=dtype, shape=shape)
+        if self.dtype.hasobject:
+            raise ValueError("Object arrays can't be streamed to .npy files")
+        self._file = open(name, 'wb')
+        self._write_header()
+
+    def _write_header(self):
+        """Write (or rewrite) the header with the current shape."""
+        from numpy.lib.format import dtype_to_descr
+        header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (
+            dtype_to_descr(self.dtype), self.shape)
+        n_pad = NPY_HEADER_LEN - len(NPY_MAGIC) - 2 - len(header) - 1
+        assert n_pad >= 0, "Shape too large for the .npy header"
+        header = header + ' ' * n_pad + '\n'
+        pos = self._file.tell()
+        self._file.seek(0)
+        self._file.write(NPY_MAGIC + struct.pack('<H', len(header)) +
+                         header.encode('latin1'))
+        if pos:
+            self._file.seek(pos)
+
+    def _write(self, chunk):
+        self._file.write(chunk.tobytes(order='C'))
+
+    def append(self, chunk):  # noqa
+        _ArrayWriter.append(self, chunk)
+        self._write_header()
+        self._file.flush()
+
+    def close(self):
+        """Close the file."""
+        if not self._file.closed:
+            self._write_header()
+            self._file.close()
+            logger.info("    %s written %s" % (self.name, str(self.shape)))
+
+
+class H5Writer(_ArrayWriter):
+    """Growable HDF5 dataset.
+
+    Parameters
+    ----------
+    name : string
+        Full path to the .h5 / .hdf5 file.
+    dtype : string | 'float64'
+        Data type of the array.
+    shape : tuple | ()
+        Shape of a single row of the array (i.e without the first axis).
+    dataset : string | 'data'
+        Name of the dataset.
+    kwargs : dict | {}
+        Additional arguments are passed to h5py.File.create_dataset (e.g
+        compression='gzip')
+    """
+
+    def __init__(self, name, dtype='float64', shape=(), dataset='data',
+                 **kwargs):  # noqa
+        import h5py
+        _ArrayWriter.__init__(self, name, dtype=dtype, shape=shape)
+        kwargs['chunks'] = kwargs.get('chunks', True)
+        self._file = h5py.File(name, 'w')
+        self._dataset = self._file.create_dataset(
+            dataset, shape=self.shape, maxshape=(None,) + self.shape_row,
+            dtype=self.dtype, **kwargs)
+
+    def _write(self, chunk):
+        n_rows = self.n_rows + chunk.shape[0]
+        self._dataset.resize(n_rows, axis=0)
+        self._dataset[self.n_rows:n_rows, ...] = chunk
+        self._file.flush()
+
+    def close(self):
+        """Close the file."""
+        if self._file.id.valid:
+            self._file.close()
+            logger.info("    %s written %s" % (self.name, str(self.shape)))
+
+
+def open_writer(name, dtype='float64', shape=(), duplicate='increment',
+                **kwargs):
+    """Open a writer streaming chunks of an array to disk.
+
+    Parameters
+    ----------
+    name : string
+        Full path to the file (.npy, .h5 or .hdf5).
+    dtype : string | 'float64'
+        Data type of the array.
+    shape : tuple | ()
+        Shape of a single row of the array. Chunks are appended along the
+        first axis.
+    duplicate : {'increment', 'overwrite', 'fail'}
+        Behavior if the file already exists.
+    kwargs : dict | {}
+        Additional arguments are passed to :class:`H5Writer`.
+
+    Returns
+    -------
+    writer : NpyWriter | H5Writer
+        The writer (to close after use).
+    """
+    file_ext = os.path.splitext(name)[1]
+    if file_ext not in ['.npy', '.h5', '.hdf5']:
+        raise IOError("Extension %s not supported for streaming." % file_ext)
+    name = safety_save(name, duplicate=duplicate, reserve=True)
+    if file_ext == '.npy':
+        return NpyWriter(name, dtype=dtype, shape=shape)
+    return H5Writer(name, dtype=dtype, shape=shape, **kwargs)